@@ -1,11 +1,45 @@
-import os, re, csv
+import os, re, csv, math, queue, threading, textwrap, time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Tuple
+from config import (
+    GEMINI_MODEL, GEMINI_BATCH_SIZE, GEMINI_BATCH_WAIT,
+    GEMINI_BATCH_TOKEN_BUDGET, GEMINI_BATCH_CONCURRENCY, GEMINI_BATCH_TIMEOUT,
+    GEMINI_SNIPPET_TOKENS, GEMINI_CONTEXT_CACHE, GEMINI_CACHE_MIN_TOKENS, GEMINI_CACHE_TTL_SECONDS,
+)
+from services import metrics, quota
+from services.logs import get_logger
 
 try:
     from google import genai
 except Exception:
     genai = None
 
+_client = None
+_client_key = None
+_client_lock = threading.Lock()
+log = get_logger("gemini")
+GEMINI_STATS = {"client_builds": 0, "requests": 0, "batches": 0, "batched_files": 0, "single_fallbacks": 0,
+                # body_tokens_raw is what the old first-20k-chars cut would have sent (estimates, 4 chars/token);
+                # prompt/cached tokens are the API's own usage counts
+                "body_tokens_raw": 0, "body_tokens_sent": 0, "prompt_tokens": 0, "cached_tokens": 0,
+                "context_caches": 0, "image_requests": 0, "image_bytes": 0}
+
+_stats_lock = threading.Lock()
+
+def _bump(key: str, n: int = 1):
+    with _stats_lock:
+        GEMINI_STATS[key] += n
+
+def get_gemini_client(api_key: str):
+    """Reuse one genai.Client (and its HTTP pool) for the whole process."""
+    global _client, _client_key
+    with _client_lock:
+        if _client is None or _client_key != api_key:
+            _client = genai.Client(api_key=api_key)
+            _client_key = api_key
+            _bump("client_builds")
+        return _client
+
 def load_folder_catalog(csv_path: str) -> tuple[dict, dict, list]:
     label_to_id, label_desc, allowed = {}, {}, []
     with open(csv_path, newline="", encoding="utf-8") as f:
@@ -23,48 +57,234 @@ def load_folder_catalog(csv_path: str) -> tuple[dict, dict, list]:
         raise RuntimeError("Folder catalog is empty.")
     return label_to_id, label_desc, allowed
 
-_KEYWORD_MAP = [
-    (re.compile(r"\b(invoice|receipt|bill|total|amount)\b", re.I), "Invoices"),
-    (re.compile(r"\b(transcript|grade|gpa|assignment|lor)\b", re.I), "Academics"),
-    (re.compile(r"\b(passport|driver.?s?\s*license|dl|national\s*id)\b", re.I), "IDs"),
-    (re.compile(r"\b(w2|1099|tax|form\s*16)\b", re.I), "Tax Docs"),
-    (re.compile(r"\b(photo|image|jpg|png|jpeg)\b", re.I), "Photos"),
-    (re.compile(r"\b(offer|employment|hr)\b", re.I), "Offers & Letters"),
-    (re.compile(r"\b(medical|prescription|lab|report)\b", re.I), "Healthcare"),
-    (re.compile(r"\b(resume|portfolio|project|spec|doc)\b", re.I), "Work"),
-]
-
-def _heuristic_label(filename: str, text: str, allowed: List[str]) -> tuple[str, float, str]:
-    hay = f"{filename}\n{text}".lower()
-    for rx, label in _KEYWORD_MAP:
-        if label in allowed and rx.search(hay):
-            return label, 0.95, f"Matched {label} keywords"
-    fallback = "Misc" if "Misc" in allowed else next(iter(allowed), None)
-    return (fallback or ""), 0.4, "Fallback (no keyword match)"
+# Used for labels whose folders.csv row has no `keywords` column/value.
+DEFAULT_KEYWORDS = {
+    "Invoices": "invoice:2|receipt:2|bill|total|amount",
+    "Academics": "transcript:2|grade|gpa:2|assignment|lor",
+    "IDs": "passport:2|driver's license:2|drivers license:2|dl|national id:2",
+    "Tax Docs": "w2:2|1099:2|tax|form 16:2",
+    "Photos": "photo|image|jpg|png|jpeg",
+    "Offers & Letters": "offer|employment|hr",
+    "Healthcare": "medical|prescription:2|lab|report",
+    "Work": "resume:2|portfolio|project|spec|doc",
+}
 
+FILENAME_WEIGHT = 3.0   # a keyword in the filename counts this many times a body hit
 
-def choose_folder_with_gemini(
-    filename: str,
-    text: str,
-    allowed_labels: List[str],
-    label_desc: Dict[str, str],
-    temperature: float = 0.15,
-) -> dict:
-    if not allowed_labels:
-        return {"label": "", "confidence": 0.0, "rationale": "No allowed labels configured"}
-    api_key = os.getenv("GEMINI_API_KEY")
-    if genai is None or not api_key:
-        lab, conf, why = _heuristic_label(filename, text, allowed_labels)
-        return {"label": lab, "confidence": conf, "rationale": why}
+def parse_keywords(spec: str) -> list[tuple[str, float]]:
+    """'invoice:2|receipt|bill' -> [('invoice', 2.0), ('receipt', 1.0), ('bill', 1.0)]"""
+    out = []
+    for item in (spec or "").split("|"):
+        kw, _, weight = item.strip().partition(":")
+        kw = " ".join(kw.lower().split())
+        if not kw:
+            continue
+        try:
+            out.append((kw, float(weight) if weight else 1.0))
+        except ValueError:
+            out.append((kw, 1.0))
+    return out
+
+_NORMALIZE = str.maketrans({"_": " ", "-": " ", ".": " ", "\u2019": "'"})
+
+class KeywordMatcher:
+    """All labels' keywords compiled into one alternation, scanned once per document."""
+
+    def __init__(self, label_keywords: Dict[str, str]):
+        self.by_group: Dict[str, List[Tuple[str, float]]] = {}
+        phrases: Dict[str, str] = {}
+        for label, spec in label_keywords.items():
+            for kw, weight in parse_keywords(spec):
+                group = phrases.setdefault(kw, f"k{len(phrases)}")
+                self.by_group.setdefault(group, []).append((label, weight))
+        # longest first so multi-word phrases win over their prefixes
+        alts = [
+            f"(?P<{group}>" + r"\s+".join(re.escape(w) for w in kw.split()) + ")"
+            for kw, group in sorted(phrases.items(), key=lambda kv: -len(kv[0]))
+        ]
+        self.rx = re.compile(r"\b(?:" + "|".join(alts) + r")\b") if alts else None
+
+    def scores(self, filename: str, text: str) -> Dict[str, float]:
+        totals: Dict[str, float] = {}
+        if self.rx is None:
+            return totals
+        for hay, mult in ((filename, FILENAME_WEIGHT), (text, 1.0)):
+            hits: Dict[str, int] = {}
+            for m in self.rx.finditer((hay or "").lower().translate(_NORMALIZE)):
+                hits[m.lastgroup] = hits.get(m.lastgroup, 0) + 1
+            for group, n in hits.items():
+                # diminishing returns: the 50th "total" says little more than the 5th
+                strength = mult * (1.0 + math.log(n))
+                for label, weight in self.by_group[group]:
+                    totals[label] = totals.get(label, 0.0) + weight * strength
+        return totals
+
+    def classify(self, filename: str, text: str, allowed: List[str]) -> tuple[str, float, str]:
+        scores = {lab: sc for lab, sc in self.scores(filename, text).items() if lab in allowed}
+        if not scores:
+            fallback = "Misc" if "Misc" in allowed else next(iter(allowed), None)
+            return (fallback or ""), 0.4, "Fallback (no keyword match)"
+        ranked = sorted(scores.items(), key=lambda kv: -kv[1])
+        label, top = ranked[0]
+        # share of the evidence that points at the winner, discounted when evidence is thin
+        share = top / (sum(scores.values()) + 1.0)
+        evidence = 1.0 - math.exp(-top / 2.0)
+        conf = round(min(0.99, share * evidence), 3)
+        runner = f", next {ranked[1][0]}={ranked[1][1]:.1f}" if len(ranked) > 1 else ""
+        return label, conf, f"Keyword score {label}={top:.1f}{runner}"
+
+_default_matcher = None
 
-    client = genai.Client(api_key=api_key)
+def heuristic_label(filename: str, text: str, allowed: List[str],
+                    matcher: KeywordMatcher | None = None) -> tuple[str, float, str]:
+    global _default_matcher
+    if matcher is None:
+        if _default_matcher is None:
+            _default_matcher = KeywordMatcher(DEFAULT_KEYWORDS)
+        matcher = _default_matcher
+    return matcher.classify(filename, text, allowed)
 
-    labels_block = "\n".join(
+
+SYSTEM_PROMPT = "You are a filing agent. Choose exactly ONE label from the allowed list. Respond ONLY with JSON."
+BATCH_SYSTEM_PROMPT = (
+    "You are a filing agent. For EACH file below choose exactly ONE label from the allowed list. "
+    "Respond ONLY with a JSON array containing one object per file, echoing its file_id."
+)
+MAX_BODY_CHARS = 20000
+SNIPPET_HEAD_SHARE = 0.4     # of the budget kept for the top of the document (title, parties, first page)
+SNIPPET_CONTEXT_LINES = 2    # lines kept on each side of a keyword hit
+SNIPPET_LINE_CHARS = 300     # long lines (one-line PDF extracts) are cut into pieces this size
+SNIPPET_GAP = "[...]"
+
+def _snippet_lines(text: str) -> List[str]:
+    """Whitespace-collapsed lines, each distinct line once (running headers, footers, boilerplate)."""
+    lines, seen = [], set()
+    for raw in (text or "").splitlines():
+        line = " ".join(raw.split())
+        if not line:
+            continue
+        for piece in textwrap.wrap(line, SNIPPET_LINE_CHARS) if len(line) > SNIPPET_LINE_CHARS else (line,):
+            key = piece.lower()
+            if key not in seen:
+                seen.add(key)
+                lines.append(piece)
+    return lines
+
+def select_snippet(text: str, matcher: KeywordMatcher | None = None,
+                   token_budget: int = GEMINI_SNIPPET_TOKENS) -> str:
+    """The part of `text` worth sending, within ~token_budget tokens (4 chars/token).
+
+    After normalizing and de-duplicating lines: the head of the document, then
+    windows around keyword hits in document order, then what follows the head.
+    Skipped stretches show as [...]. token_budget <= 0 keeps the old first-20k cut.
+    """
+    if token_budget <= 0:
+        return (text or "")[:MAX_BODY_CHARS]
+    budget = min(token_budget * 4, MAX_BODY_CHARS)
+    lines = _snippet_lines(text)
+    if sum(len(line) + 1 for line in lines) <= budget:
+        return "\n".join(lines)
+
+    picked, used = set(), 0
+
+    def take(i: int, limit: float) -> bool:
+        nonlocal used
+        cost = len(lines[i]) + 1
+        if i in picked or used + cost > limit:
+            return i in picked
+        picked.add(i)
+        used += cost
+        return True
+
+    head_end = 0
+    while head_end < len(lines) and take(head_end, budget * SNIPPET_HEAD_SHARE):
+        head_end += 1
+    if matcher is not None and matcher.rx is not None:
+        for i in range(head_end, len(lines)):
+            if used >= budget:
+                break
+            if matcher.rx.search(lines[i].lower().translate(_NORMALIZE)):
+                for j in range(max(head_end, i - SNIPPET_CONTEXT_LINES), min(len(lines), i + SNIPPET_CONTEXT_LINES + 1)):
+                    take(j, budget)
+    for i in range(head_end, len(lines)):
+        if not take(i, budget):
+            break
+
+    out, prev = [], -1
+    for i in sorted(picked):
+        if i != prev + 1:
+            out.append(SNIPPET_GAP)
+        out.append(lines[i])
+        prev = i
+    if prev != len(lines) - 1:
+        out.append(SNIPPET_GAP)
+    return "\n".join(out)
+
+def _labels_block(allowed_labels: List[str], label_desc: Dict[str, str]) -> str:
+    return "\n".join(
         f"- {lab}: {label_desc.get(lab, '')}" if label_desc.get(lab) else f"- {lab}"
         for lab in allowed_labels
     )
-    body = (text or "")[:20000]
-    system = "You are a filing agent. Choose exactly ONE label from the allowed list. Respond ONLY with JSON."
+
+# The system prompt + labels block is identical on every call, so it goes first
+# and byte-stable as the system instruction (Gemini's implicit prefix caching
+# applies); once it is big enough for an explicit context cache, it is stored
+# once and referenced by name until shortly before the TTL runs out. One
+# thread creates it while the others keep sending the prefix inline; a failed
+# create is retried after a pause (longer unless it was throttled or transient).
+CACHE_RETRY_SECONDS = 60
+CACHE_RETRY_PERMANENT_SECONDS = 1800
+_prefix_caches: Dict[tuple, tuple] = {}   # key -> (cache name, expires at)
+_prefix_retry_at: Dict[tuple, float] = {}
+_prefix_creating: set = set()
+_prefix_lock = threading.Lock()
+
+def _prefix_config(client, system_prompt: str, allowed_labels: List[str], label_desc: Dict[str, str]) -> dict:
+    instruction = f"{system_prompt}\n\nAllowed labels:\n{_labels_block(allowed_labels, label_desc)}"
+    if not GEMINI_CONTEXT_CACHE or len(instruction) // 4 < GEMINI_CACHE_MIN_TOKENS:
+        return {"system_instruction": instruction}
+    key = (GEMINI_MODEL, instruction)
+    now = time.monotonic()
+    with _prefix_lock:
+        name, expires = _prefix_caches.get(key, (None, 0.0))
+        if now < expires:
+            return {"cached_content": name}
+        if key in _prefix_creating or now < _prefix_retry_at.get(key, 0.0):
+            return {"system_instruction": instruction}
+        _prefix_creating.add(key)
+    try:
+        cache = quota.call("gemini", lambda: client.caches.create(
+            model=GEMINI_MODEL,
+            config={"system_instruction": instruction, "ttl": f"{GEMINI_CACHE_TTL_SECONDS}s",
+                    "display_name": "folderheist-labels"},
+        ), retries=0)
+    except Exception as e:
+        if quota.is_throttle(e) or quota.is_transient(e):
+            delay = max(CACHE_RETRY_SECONDS, quota.retry_after(e) or 0.0)
+        else:
+            delay = CACHE_RETRY_PERMANENT_SECONDS
+        log.warning("Context cache unavailable, sending the prefix inline", retry_in_s=round(delay), error=str(e))
+        with _prefix_lock:
+            _prefix_retry_at[key] = time.monotonic() + delay
+        return {"system_instruction": instruction}
+    finally:
+        with _prefix_lock:
+            _prefix_creating.discard(key)
+    _bump("context_caches")
+    with _prefix_lock:
+        _prefix_caches[key] = (cache.name, time.monotonic() + GEMINI_CACHE_TTL_SECONDS * 0.9)
+        _prefix_retry_at.pop(key, None)
+    return {"cached_content": cache.name}
+
+def _record_usage(resp):
+    usage = getattr(resp, "usage_metadata", None)
+    if usage is not None:
+        _bump("prompt_tokens", getattr(usage, "prompt_token_count", 0) or 0)
+        _bump("cached_tokens", getattr(usage, "cached_content_token_count", 0) or 0)
+
+def _gemini_single(client, filename: str, text: str, allowed_labels: List[str],
+                   label_desc: Dict[str, str], temperature: float, image: tuple | None = None) -> dict:
+    body = (text or "")[:MAX_BODY_CHARS]   # already a snippet when called via choose_folder_with_gemini
     schema = {
         "type": "OBJECT",
         "properties": {
@@ -74,28 +294,324 @@ def choose_folder_with_gemini(
         },
         "required": ["label", "confidence", "rationale"],
     }
-    prompt = f"""Allowed labels:
-{labels_block}
-
-Filename: {filename}
-Body (first 20k chars):
+    prompt = f"""Filename: {filename}
+Body (excerpt):
 {body}
 """
-    try:
-        resp = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=[system, prompt],
-            config={"temperature": temperature,
-                    "response_mime_type": "application/json",
-                    "response_schema": schema},
+    contents = [prompt]
+    if image is not None:
+        # a downscaled preview of a photo or scan, never the original
+        data, mime = image
+        contents = [{"inline_data": {"mime_type": mime, "data": data}},
+                    prompt + "The attached image is a preview of the file.\n"]
+        _bump("image_requests")
+        _bump("image_bytes", len(data))
+    prefix = _prefix_config(client, SYSTEM_PROMPT, allowed_labels, label_desc)
+    _bump("requests")
+    resp = quota.call("gemini", lambda: client.models.generate_content(
+        model=GEMINI_MODEL,
+        contents=contents,
+        config={**prefix,
+                "temperature": temperature,
+                "response_mime_type": "application/json",
+                "response_schema": schema},
+    ))
+    _record_usage(resp)
+    return getattr(resp, "parsed", None) or {}
+
+def _pack_batches(items: List[dict], token_budget: int) -> List[List[dict]]:
+    """Greedy packing by estimated tokens (~4 chars/token); oversized items travel alone."""
+    batches, current, used = [], [], 0
+    for item in items:
+        cost = (len(item["filename"]) + min(len(item["text"] or ""), MAX_BODY_CHARS)) // 4 + 20
+        if current and used + cost > token_budget:
+            batches.append(current)
+            current, used = [], 0
+        current.append(item)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+def classify_batch_with_gemini(
+    items: List[dict],
+    allowed_labels: List[str],
+    label_desc: Dict[str, str],
+    temperature: float = 0.15,
+    token_budget: int = GEMINI_BATCH_TOKEN_BUDGET,
+) -> Dict[str, dict]:
+    """Classify many {file_id, filename, text} items with as few requests as possible.
+
+    Returns {file_id: parsed} for items Gemini answered with a valid label; the
+    caller decides what to do with the rest (see _run_batch).
+    """
+    api_key = os.getenv("GEMINI_API_KEY")
+    if genai is None or not api_key or not items:
+        return {}
+    client = get_gemini_client(api_key)
+    schema = {
+        "type": "ARRAY",
+        "items": {
+            "type": "OBJECT",
+            "properties": {
+                "file_id": {"type": "STRING"},
+                "label": {"type": "STRING", "enum": allowed_labels},
+                "confidence": {"type": "NUMBER"},
+                "rationale": {"type": "STRING"},
+            },
+            "required": ["file_id", "label", "confidence", "rationale"],
+        },
+    }
+    results: Dict[str, dict] = {}
+    prefix = _prefix_config(client, BATCH_SYSTEM_PROMPT, allowed_labels, label_desc)
+    for batch in _pack_batches(items, token_budget):
+        # short request-local ids: cheaper than Drive ids and harder to garble
+        local_ids = {f"f{i}": item["file_id"] for i, item in enumerate(batch)}
+        files_block = "\n\n".join(
+            f"### file_id: f{i}\nFilename: {item['filename']}\nBody:\n{(item['text'] or '')[:MAX_BODY_CHARS]}"
+            for i, item in enumerate(batch)
         )
-        parsed = getattr(resp, "parsed", None) or {}
+        prompt = f"""Files ({len(batch)}):
+{files_block}
+"""
+        try:
+            _bump("requests")
+            _bump("batches")
+            _bump("batched_files", len(batch))
+            resp = quota.call("gemini", lambda: client.models.generate_content(
+                model=GEMINI_MODEL,
+                contents=[prompt],
+                config={**prefix,
+                        "temperature": temperature,
+                        "response_mime_type": "application/json",
+                        "response_schema": schema},
+            ))
+            _record_usage(resp)
+            parsed = getattr(resp, "parsed", None) or []
+        except quota.QuotaExceeded:
+            raise   # the remaining batches would be throttled too
+        except Exception as e:
+            log.warning("Batch request failed", files=len(batch), error=str(e))
+            continue
+        for entry in parsed:
+            fid = local_ids.get((entry or {}).get("file_id"))
+            if fid and entry.get("label") in allowed_labels:
+                results[fid] = entry
+    return results
+
+class _Pending:
+    __slots__ = ("item", "done", "result", "error")
+
+    def __init__(self, item: dict):
+        self.item = item
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+_batch_queue: queue.Queue = queue.Queue()
+_batch_pool = None
+_batch_thread = None
+_batch_callers = 0   # threads that can block in _classify_batched (worker pool, backfill pool)
+
+def add_batch_callers(n: int):
+    """Register (or, with a negative n, release) threads that wait on batches.
+
+    Callers block until their batch returns, so a batch can never hold more
+    files than there are callers; it is sent as soon as it has that many
+    instead of waiting out GEMINI_BATCH_WAIT for files that cannot arrive.
+    """
+    global _batch_callers
+    with _client_lock:
+        _batch_callers = max(0, _batch_callers + n)
+
+def _batch_limit() -> int:
+    callers = _batch_callers
+    return min(GEMINI_BATCH_SIZE, callers) if callers > 0 else GEMINI_BATCH_SIZE
+
+def _fail(pending: List[_Pending], error: Exception):
+    for p in pending:
+        if not p.done.is_set():
+            p.error = error
+            p.done.set()
+
+def _run_batch(pending: List[_Pending]):
+    """Answer a group; every caller is released however this ends."""
+    try:
+        _answer_batch(pending)
+    except Exception as e:
+        log.error("Batch worker failed", files=len(pending), error=str(e))
+        _fail(pending, e)
+    finally:
+        _fail(pending, RuntimeError("Batch ended without an answer"))
+
+def _answer_batch(pending: List[_Pending]):
+    first = pending[0].item
+    allowed, label_desc, temperature = first["allowed_labels"], first["label_desc"], first["temperature"]
+    try:
+        results = classify_batch_with_gemini([p.item for p in pending], allowed, label_desc, temperature)
+    except quota.QuotaExceeded as e:
+        # no per-file fallbacks while over quota: every caller requeues its file
+        _fail(pending, e)
+        return
+    except Exception as e:
+        results = {}
+        log.warning("Batch classification failed", files=len(pending), error=str(e))
+    client = None
+    for p in pending:
+        fid = p.item["file_id"]
+        if fid in results:
+            p.result = results[fid]
+        else:
+            # partial failure: this file gets its own request
+            try:
+                _bump("single_fallbacks")
+                metrics.inc("folderheist_router_fallback_total", reason="gemini_batch_partial")
+                client = client or get_gemini_client(os.getenv("GEMINI_API_KEY"))
+                p.result = _gemini_single(client, p.item["filename"], p.item["text"],
+                                          allowed, label_desc, temperature)
+            except Exception as e:
+                p.error = e
+        p.done.set()
+
+def _batch_loop():
+    while True:
+        pending = [_batch_queue.get()]
+        deadline = time.monotonic() + GEMINI_BATCH_WAIT
+        while len(pending) < _batch_limit():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                pending.append(_batch_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        # one request can only carry one label set / temperature
+        groups: Dict[tuple, List[_Pending]] = {}
+        try:
+            for p in pending:
+                key = (tuple(p.item["allowed_labels"]), p.item["temperature"])
+                groups.setdefault(key, []).append(p)
+        except Exception as e:
+            log.error("Batch grouping failed", files=len(pending), error=str(e))
+            _fail(pending, e)
+            continue
+        for group in groups.values():
+            try:
+                _batch_pool.submit(_run_batch, group)
+            except Exception as e:
+                _fail(group, e)
+
+def _classify_batched(item: dict) -> dict:
+    """Block the calling worker until its file's batch has been answered."""
+    global _batch_pool, _batch_thread
+    with _client_lock:
+        if _batch_thread is None:
+            _batch_pool = ThreadPoolExecutor(max_workers=GEMINI_BATCH_CONCURRENCY, thread_name_prefix="gemini")
+            _batch_thread = threading.Thread(target=_batch_loop, name="gemini-batcher", daemon=True)
+            _batch_thread.start()
+    p = _Pending(item)
+    _batch_queue.put(p)
+    if not p.done.wait(GEMINI_BATCH_TIMEOUT):
+        raise TimeoutError(f"No batch answer after {GEMINI_BATCH_TIMEOUT:g}s")
+    if p.error is not None:
+        raise p.error
+    return p.result or {}
+
+def _cheap_tiers(filename: str, text: str, allowed_labels: List[str], matcher, local_model,
+                 conf_threshold: float) -> tuple[dict, bool]:
+    """Keyword scorer, then the local model: (best answer, whether it clears the threshold)."""
+    with metrics.span("classify_keywords"):
+        lab, conf, why = heuristic_label(filename, text, allowed_labels, matcher)
+    metrics.inc("folderheist_router_tier_total", tier="keywords")
+    best = {"label": lab, "confidence": conf, "rationale": why, "source": "keywords"}
+    if conf >= conf_threshold:
+        return best, True
+
+    if local_model is not None:
+        with metrics.span("classify_local"):
+            pred = local_model.predict(filename, text, allowed_labels)
+        metrics.inc("folderheist_router_tier_total", tier="local")
+        if pred is not None:
+            lab, conf, why = pred
+            if conf >= conf_threshold or conf > best["confidence"]:
+                best = {"label": lab, "confidence": conf, "rationale": why, "source": "local"}
+            if conf >= conf_threshold:
+                return best, True
+    return best, False
+
+def choose_folder_with_gemini(
+    filename: str,
+    text: str,
+    allowed_labels: List[str],
+    label_desc: Dict[str, str],
+    temperature: float = 0.15,
+    matcher: KeywordMatcher | None = None,
+    local_model=None,
+    conf_threshold: float = 0.55,
+    file_id: str | None = None,
+    media=None,
+) -> dict:
+    """Tiered routing: keyword scorer, then the local model, then Gemini.
+
+    Each tier only runs when the previous one is below `conf_threshold`; the
+    best cheap answer is kept as the fallback if Gemini is weak or unavailable.
+    With a `file_id` and GEMINI_BATCH_SIZE > 1, concurrent callers share one
+    Gemini request. `media` is a callable returning (OCR text, (bytes, mime)
+    preview or None) for photos and scans; it only runs once the cheap tiers
+    have failed on the name and metadata. OCR text goes back through them
+    before Gemini; a preview gets its own multimodal request. Raises quota.QuotaExceeded if Gemini stays throttled, so
+    the caller can requeue instead of misrouting.
+    """
+    if not allowed_labels:
+        return {"label": "", "confidence": 0.0, "rationale": "No allowed labels configured"}
+
+    best, done = _cheap_tiers(filename, text, allowed_labels, matcher, local_model, conf_threshold)
+    if done:
+        return best
+
+    preview = None
+    if media is not None:
+        extra, preview = media()
+        if extra:
+            text = "\n".join(filter(None, (text, extra)))
+            scanned, done = _cheap_tiers(filename, text, allowed_labels, matcher, local_model, conf_threshold)
+            if done or scanned["confidence"] > best["confidence"]:
+                best = scanned
+            if done:
+                return best
+
+    api_key = os.getenv("GEMINI_API_KEY")
+    if genai is None or not api_key:
+        metrics.inc("folderheist_router_fallback_total", reason="gemini_unavailable")
+        return best
+
+    metrics.inc("folderheist_router_tier_total", tier="gemini")
+    snippet = select_snippet(text, matcher)
+    _bump("body_tokens_raw", min(len(text or ""), MAX_BODY_CHARS) // 4)
+    _bump("body_tokens_sent", len(snippet) // 4)
+    try:
+        with metrics.span("classify_gemini"):
+            if file_id is not None and GEMINI_BATCH_SIZE > 1 and preview is None:
+                parsed = _classify_batched({
+                    "file_id": file_id, "filename": filename, "text": snippet,
+                    "allowed_labels": list(allowed_labels), "label_desc": dict(label_desc),
+                    "temperature": temperature,
+                })
+            else:
+                parsed = _gemini_single(get_gemini_client(api_key), filename, snippet,
+                                        allowed_labels, label_desc, temperature, preview)
         lab = parsed.get("label")
         conf = float(parsed.get("confidence", 0.0) or 0.0)
         why = parsed.get("rationale", "")
         if lab not in allowed_labels:
-            lab, conf, why = _heuristic_label(filename, text, allowed_labels)
-        return {"label": lab, "confidence": conf, "rationale": why}
+            metrics.inc("folderheist_router_fallback_total", reason="gemini_invalid_label")
+            return best
+        if conf < conf_threshold and best["confidence"] > conf:
+            metrics.inc("folderheist_router_fallback_total", reason="gemini_low_confidence")
+            return best
+        return {"label": lab, "confidence": conf, "rationale": why, "source": "gemini"}
+    except quota.QuotaExceeded:
+        raise   # over quota: requeue the file rather than settle for a weak cheap answer
     except Exception as e:
-        lab, conf, why = _heuristic_label(filename, text, allowed_labels)
-        return {"label": lab, "confidence": conf, "rationale": f"Heuristic fallback ({e})"}
+        metrics.inc("folderheist_router_fallback_total", reason="gemini_error")
+        return {**best, "rationale": f"Heuristic fallback ({e})"}
@@ -4,18 +4,27 @@ from services.notifications import register_routes
 
 from services.drive_client import get_drive
 from services.labels import hydrate_labels
+from services.worker import start_workers, request_catch_up
+from services.channels import load_channels, start_scheduler
+from services.logs import get_logger
 
+log = get_logger("boot")
 app = Flask(__name__)
 register_routes(app)
 
 if __name__ == "__main__":
-    print(APP_URL)
+    log.info("Starting", app_url=APP_URL, port=PORT)
     require_env()
 
     try:
         drive = get_drive()
         hydrate_labels(drive)
     except Exception as e:
-        print(f"[BOOT] Label preload failed: {e}")
+        log.error("Label preload failed", error=str(e))
 
+    start_workers()
+    if load_channels():
+        # we were watching before this restart: pick up what changed while down
+        request_catch_up()
+        start_scheduler()
     app.run(host="0.0.0.0", port=PORT)
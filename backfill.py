@@ -0,0 +1,29 @@
+"""Route the files already sitting in DRIVE_FOLDER_ID (or, with --reorganize, every label folder).
+
+    python backfill.py --dry-run            # routing report only
+    python backfill.py                      # move them; rerun the same command to resume
+
+Progress is checkpointed in the journal under the run name (default: mode, scope
+and catalog version), and the routing report lands in BACKFILL_REPORT_DIR.
+"""
+import argparse
+import json
+from config import DRIVE_FOLDER_ID, DRIVE_PARENT_ID, BACKFILL_CONCURRENCY
+from services.backfill import run_backfill
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dry-run", action="store_true", help="classify and report, move nothing")
+    parser.add_argument("--reorganize", action="store_true", help="also re-route files already in label folders")
+    parser.add_argument("--run", help="run name to start or resume (default derives from the catalog)")
+    parser.add_argument("--concurrency", type=int, default=BACKFILL_CONCURRENCY)
+    args = parser.parse_args()
+
+    if not DRIVE_FOLDER_ID or not DRIVE_PARENT_ID:
+        raise SystemExit("Set DRIVE_FOLDER_ID and DRIVE_PARENT_ID.")
+    status = run_backfill(run=args.run, dry_run=args.dry_run, reorganize=args.reorganize,
+                          concurrency=args.concurrency)
+    print(json.dumps(status, indent=2, default=str))
+
+if __name__ == "__main__":
+    main()
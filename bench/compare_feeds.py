@@ -0,0 +1,52 @@
+"""Compare the two ingestion feeds over the same window.
+
+    python -m bench.compare_feeds --page-token <token> --since 2025-01-01T00:00:00.000Z
+
+Walks both feeds without touching the journal or the queue and reports pages
+(= API calls), items fetched vs items inside DRIVE_FOLDER_ID, payload size and
+wall time.
+"""
+import argparse
+import json
+import time
+from config import DRIVE_FOLDER_ID
+from services.feeds import iter_change_pages, iter_folder_pages
+
+def measure(pages) -> dict:
+    started = time.perf_counter()
+    n_pages = fetched = relevant = payload = 0
+    for items, _ in pages:
+        n_pages += 1
+        fetched += len(items)
+        relevant += sum(1 for f, _ in items if DRIVE_FOLDER_ID in (f.get("parents") or []))
+        payload += len(json.dumps(items))
+    elapsed = time.perf_counter() - started
+    return {
+        "api_calls": n_pages,
+        "fetched": fetched,
+        "relevant": relevant,
+        "relevant_pct": round(100.0 * relevant / fetched, 1) if fetched else 0.0,
+        "payload_bytes": payload,
+        "seconds": round(elapsed, 3),
+    }
+
+def compare(drive, page_token: str, since: str) -> dict:
+    return {
+        "changes": measure(iter_change_pages(drive, page_token)),
+        "folder": measure(iter_folder_pages(drive, DRIVE_FOLDER_ID, since)),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--page-token", help="changes feed start (default: journal checkpoint)")
+    parser.add_argument("--since", required=True, help="folder feed start, RFC 3339 modifiedTime")
+    args = parser.parse_args()
+
+    from services import journal
+    from services.drive_client import get_drive, read_start_page_token
+    drive = get_drive()
+    token = args.page_token or journal.page_token() or read_start_page_token(drive)
+    print(json.dumps(compare(drive, token, args.since), indent=2))
+
+if __name__ == "__main__":
+    main()
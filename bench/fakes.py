@@ -0,0 +1,409 @@
+"""In-process stand-ins for the Drive v3 service and the genai client.
+
+FakeDrive implements the slice of the discovery-built service this app calls:
+changes().getStartPageToken/list/watch, files().get/get_media/export/
+export_media/update/list/create, channels().stop and new_batch_http_request.
+Media requests speak the byte-range protocol MediaIoBaseDownload uses, so the
+real download code runs unchanged, and thumbnailLink renditions are served
+through `thumbnail_http`, which stands in for drive_client.get_http(). Every call is counted
+(bytes served per kind in `bytes_served`), can be delayed
+(`latency`, seconds, per call name or "*"), can fail with an HttpError at
+`error_rate`, and answers 429 + Retry-After above `quota_qps` calls/second.
+"""
+import hashlib
+import itertools
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+from config import FOLDER_MIME
+
+def _http_error(status: int, uri: str = "fake://drive", retry_after: int | None = None) -> HttpError:
+    headers = {"status": status}
+    if retry_after is not None:
+        headers["retry-after"] = str(retry_after)
+    return HttpError(httplib2.Response(headers), b'{"error": "injected"}', uri=uri)
+
+class _Quota:
+    """Calls allowed per rolling second; 0 = unlimited."""
+
+    def __init__(self, qps: float):
+        self.qps = qps
+        self._window: list = []
+        self._lock = threading.Lock()
+
+    def exceeded(self) -> bool:
+        if not self.qps:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            while self._window and now - self._window[0] >= 1.0:
+                self._window.pop(0)
+            if len(self._window) >= self.qps:
+                return True
+            self._window.append(now)
+            return False
+
+class _Request:
+    def __init__(self, drive, name: str, fn):
+        self.drive, self.name, self._fn = drive, name, fn
+
+    def execute(self, num_retries: int = 0):
+        return self.drive._call(self.name, self._fn)
+
+class _MediaHttp:
+    """Answers MediaIoBaseDownload's ranged GETs from an in-memory body."""
+
+    def __init__(self, drive, name: str, data: bytes):
+        self.drive, self.name, self.data = drive, name, data
+
+    def request(self, uri, method="GET", headers=None, **kwargs):
+        try:
+            self.drive._call(self.name, lambda: None)
+        except HttpError as e:
+            return e.resp, e.content
+        total = len(self.data)
+        if not total:
+            return httplib2.Response({"status": 416, "content-range": "bytes */0"}), b""
+        m = re.match(r"bytes=(\d+)-(\d+)", (headers or {}).get("range", ""))
+        start, end = (int(m.group(1)), int(m.group(2))) if m else (0, total - 1)
+        end = min(end, total - 1)
+        chunk = self.data[start:end + 1]
+        self.drive._served("media", len(chunk))
+        return httplib2.Response({"status": 206, "content-range": f"bytes {start}-{end}/{total}"}), chunk
+
+class _MediaRequest(_Request):
+    def __init__(self, drive, name: str, data: bytes):
+        super().__init__(drive, name, lambda: data)
+        self.uri = f"fake://{name}"
+        self.headers = {}
+        self.http = _MediaHttp(drive, name, data)
+
+class _ThumbnailHttp:
+    """drive_client.get_http()'s authorized transport, as far as thumbnailLink fetches go."""
+
+    def __init__(self, drive):
+        self.drive = drive
+
+    def request(self, uri, method="GET", headers=None, **kwargs):
+        m = re.match(r"fake://thumbnail/(\w+)=s(\d+)$", uri)
+        try:
+            self.drive._call("thumbnail", lambda: None)
+            if not m or m.group(1) not in self.drive.store:
+                raise _http_error(404, uri)
+        except HttpError as e:
+            return e.resp, e.content
+        original = self.drive.content[m.group(1)]
+        px = int(m.group(2))
+        # roughly a JPEG at that size, never more than the original
+        data = hashlib.sha256(original).digest() * (min(len(original), px * px // 6) // 32 + 1)
+        self.drive._served("thumbnail", len(data))
+        return httplib2.Response({"status": 200, "content-type": "image/jpeg"}), data
+
+class _Batch:
+    def __init__(self, drive, callback):
+        self.drive, self.callback, self.requests = drive, callback, []
+
+    def add(self, request, request_id=None, callback=None):
+        self.requests.append((request, str(request_id or len(self.requests)), callback or self.callback))
+
+    def execute(self):
+        if len(self.requests) > 100:
+            raise ValueError("Drive batches are capped at 100 calls")
+        self.drive._call("batch", lambda: None)
+        for request, request_id, callback in self.requests:
+            try:
+                self.drive._inject(request.name)
+                response, exc = request._fn(), None
+            except HttpError as e:
+                response, exc = None, e
+            self.drive._count(request.name + "[batched]")
+            callback(request_id, response, exc)
+
+class _Resource:
+    def __init__(self, **methods):
+        self.__dict__.update(methods)
+
+class FakeDrive:
+    def __init__(self, latency=0.0, error_rate: float = 0.0, error_status: int = 503,
+                 quota_qps: float = 0.0, seed: int = 0):
+        self.latency = latency if isinstance(latency, dict) else {"*": latency}
+        self.quota = _Quota(quota_qps)
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.calls = Counter()
+        self.store: dict = {}
+        self.content: dict = {}
+        self.log: list = []          # (change time, file id), the changes feed
+        self._ids = itertools.count(1)
+        self._last = datetime.min.replace(tzinfo=timezone.utc)
+        self._lock = threading.RLock()
+        self._rand = random.Random(seed)
+        self.channels_open: set = set()
+        self.bytes_served = Counter()
+        self.thumbnail_http = _ThumbnailHttp(self)
+
+    # -- plumbing ------------------------------------------------------------
+
+    def _count(self, name: str):
+        with self._lock:
+            self.calls[name] += 1
+
+    def _served(self, kind: str, n: int):
+        with self._lock:
+            self.bytes_served[kind] += n
+
+    def _inject(self, name: str):
+        if name != "batch" and self.quota.exceeded():
+            self._count("throttled")
+            raise _http_error(429, f"fake://{name}", retry_after=1)
+        if self.error_rate and name != "batch":
+            with self._lock:
+                fail = self._rand.random() < self.error_rate
+            if fail:
+                self._count("errors")
+                raise _http_error(self.error_status, f"fake://{name}")
+
+    def _call(self, name: str, fn):
+        self._count(name)
+        delay = self.latency.get(name, self.latency.get("*", 0.0))
+        if delay:
+            with self._lock:
+                jitter = 0.5 + self._rand.random()
+            time.sleep(delay * jitter)
+        self._inject(name)
+        return fn()
+
+    def _now(self) -> str:
+        # wall clock, strictly increasing at the millisecond precision Drive reports
+        now = datetime.now(timezone.utc)
+        now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+        t = self._last = max(now, self._last + timedelta(milliseconds=1))
+        return t.strftime("%Y-%m-%dT%H:%M:%S.") + f"{t.microsecond // 1000:03d}Z"
+
+    def _touch(self, file_id: str):
+        when = self._now()
+        self.store[file_id]["modifiedTime"] = when
+        self.log.append((when, file_id))
+
+    def _get(self, file_id: str) -> dict:
+        if file_id not in self.store:
+            raise _http_error(404, f"fake://files/{file_id}")
+        return self.store[file_id]
+
+    # -- seeding -------------------------------------------------------------
+
+    def add_file(self, name: str, mime: str, parent: str, data: bytes = b"") -> str:
+        with self._lock:
+            file_id = f"fake{next(self._ids):06d}"
+            meta = {"id": file_id, "name": name, "mimeType": mime, "parents": [parent], "trashed": False}
+            if mime != FOLDER_MIME and not mime.startswith("application/vnd.google-apps."):
+                meta["size"] = str(len(data))
+                meta["md5Checksum"] = hashlib.md5(data).hexdigest()
+            if mime.startswith("image/") or mime == "application/pdf":
+                meta["hasThumbnail"] = True
+                meta["thumbnailLink"] = f"fake://thumbnail/{file_id}=s220"
+            if mime.startswith("image/"):
+                meta["imageMediaMetadata"] = {"width": 4032, "height": 3024}
+            self.store[file_id] = meta
+            self.content[file_id] = data
+            self._touch(file_id)
+            return file_id
+
+    def add_folder(self, name: str, parent: str) -> str:
+        return self.add_file(name, FOLDER_MIME, parent)
+
+    # -- service surface -----------------------------------------------------
+
+    def new_batch_http_request(self, callback=None):
+        return _Batch(self, callback)
+
+    def changes(self):
+        def get_start_page_token(**kw):
+            return _Request(self, "changes.getStartPageToken",
+                            lambda: {"startPageToken": str(len(self.log))})
+
+        def list_(pageToken, pageSize=100, **kw):
+            def run():
+                with self._lock:
+                    start = int(pageToken)
+                    window = self.log[start:start + pageSize]
+                    resp = {"changes": [
+                        {"time": when, "fileId": fid, "file": dict(self.store[fid])} for when, fid in window
+                    ]}
+                    if start + pageSize < len(self.log):
+                        resp["nextPageToken"] = str(start + pageSize)
+                    else:
+                        resp["newStartPageToken"] = str(len(self.log))
+                    return resp
+            return _Request(self, "changes.list", run)
+
+        def watch(body, pageToken=None, **kw):
+            def run():
+                self.channels_open.add(body["id"])
+                cap = int(time.time() * 1000) + 7 * 86400 * 1000
+                expires = min(int(body.get("expiration") or cap), cap)
+                return {"kind": "api#channel", "id": body["id"], "resourceId": "fake-changes",
+                        "expiration": str(expires)}
+            return _Request(self, "changes.watch", run)
+
+        return _Resource(getStartPageToken=get_start_page_token, list=list_, watch=watch)
+
+    def channels(self):
+        def stop(body, **kw):
+            return _Request(self, "channels.stop", lambda: self.channels_open.discard(body["id"]))
+        return _Resource(stop=stop)
+
+    def files(self):
+        def get(fileId, **kw):
+            return _Request(self, "files.get", lambda: dict(self._get(fileId)))
+
+        def get_media(fileId, **kw):
+            return _MediaRequest(self, "files.get_media", self.content.get(fileId, b""))
+
+        def export_media(fileId, mimeType, **kw):
+            return _MediaRequest(self, "files.export", self.content.get(fileId, b""))
+
+        def export(fileId, mimeType, **kw):
+            return _Request(self, "files.export", lambda: self.content.get(fileId, b""))
+
+        def update(fileId, addParents="", removeParents="", body=None, **kw):
+            def run():
+                with self._lock:
+                    meta = self._get(fileId)
+                    parents = [p for p in meta["parents"] if p not in removeParents.split(",")]
+                    parents += [p for p in addParents.split(",") if p and p not in parents]
+                    meta["parents"] = parents
+                    meta.update(body or {})
+                    self._touch(fileId)
+                    return {"id": fileId, "parents": list(parents)}
+            return _Request(self, "files.update", run)
+
+        def create(body, **kw):
+            def run():
+                fid = self.add_file(body["name"], body.get("mimeType", "application/octet-stream"),
+                                    (body.get("parents") or ["root"])[0])
+                return {"id": fid}
+            return _Request(self, "files.create", run)
+
+        def list_(q="", pageSize=100, pageToken=None, orderBy=None, **kw):
+            def run():
+                with self._lock:
+                    hits = [dict(f) for f in self.store.values() if _matches(f, q)]
+                if orderBy == "modifiedTime":
+                    hits.sort(key=lambda f: f["modifiedTime"])
+                start = int(pageToken or 0)
+                resp = {"files": hits[start:start + pageSize]}
+                if start + pageSize < len(hits):
+                    resp["nextPageToken"] = str(start + pageSize)
+                return resp
+            return _Request(self, "files.list", run)
+
+        return _Resource(get=get, get_media=get_media, export=export, export_media=export_media,
+                         update=update, create=create, list=list_)
+
+_Q_STR = r"'((?:[^'\\]|\\.)*)'"
+
+def _unescape(value: str) -> str:
+    return re.sub(r"\\(.)", r"\1", value)
+
+def _matches(f: dict, q: str) -> bool:
+    """The handful of Drive query clauses this app writes, ANDed together."""
+    for m in re.finditer(_Q_STR + r" in parents", q):
+        if _unescape(m.group(1)) not in f["parents"]:
+            return False
+    for field, op in (("name", "="), ("mimeType", "="), ("mimeType", "!="), ("modifiedTime", ">=")):
+        for m in re.finditer(rf"\b{field} {re.escape(op)} " + _Q_STR, q):
+            value = _unescape(m.group(1))
+            have = f.get(field, "")
+            if (op == "=" and have != value) or (op == "!=" and have == value) or (op == ">=" and have < value):
+                return False
+    if "trashed = false" in q and f.get("trashed"):
+        return False
+    return True
+
+class FakeQuotaError(Exception):
+    """Shaped like google.genai's ClientError for a RESOURCE_EXHAUSTED answer."""
+    code = 429
+    status = "RESOURCE_EXHAUSTED"
+    details = {"error": {"details": [{"retryDelay": "1s"}]}}
+
+    def __init__(self):
+        super().__init__(f"429 RESOURCE_EXHAUSTED. {self.details}")
+
+class FakeGenai:
+    """genai.Client stand-in: answers from `truth` (filename -> label) when it can.
+
+    Labels come from the response schema's enum, so single and batched requests
+    both work; prompt sizes are tallied so prompt changes show up in reports.
+    A system instruction counts as sent; a cached_content reference counts
+    toward cached_chars instead.
+    """
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, truth: dict | None = None,
+                 quota_qps: float = 0.0, seed: int = 0):
+        self.latency, self.error_rate = latency, error_rate
+        self.quota = _Quota(quota_qps)
+        self.truth = truth if truth is not None else {}
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self._rand = random.Random(seed)
+        self._caches: dict = {}
+        self.models = self
+        self.caches = SimpleNamespace(create=self._create_cache)
+
+    def _create_cache(self, model, config):
+        with self._lock:
+            self.calls["caches.create"] += 1
+            name = f"cachedContents/{len(self._caches)}"
+            self._caches[name] = config.get("system_instruction") or ""
+        return SimpleNamespace(name=name)
+
+    def _answer(self, filename: str, allowed: list) -> dict:
+        label = self.truth.get(filename)
+        if label not in allowed:
+            label = allowed[int(hashlib.md5(filename.encode()).hexdigest(), 16) % len(allowed)]
+        return {"label": label, "confidence": 0.9, "rationale": "fake"}
+
+    def generate_content(self, model, contents, config=None):
+        prompt = "\n".join(c if isinstance(c, str) else str(c) for c in contents if not isinstance(c, dict))
+        image_bytes = sum(len(c["inline_data"]["data"]) for c in contents if isinstance(c, dict) and "inline_data" in c)
+        config = config or {}
+        with self._lock:
+            self.calls["image_bytes"] += image_bytes
+            cached = len(self._caches.get(config.get("cached_content"), ""))
+            sent = len(prompt) + len(config.get("system_instruction") or "")
+            self.calls["generate_content"] += 1
+            self.calls["prompt_chars"] += sent
+            self.calls["cached_chars"] += cached
+            fail = self._rand.random() < self.error_rate
+        if self.quota.exceeded():
+            with self._lock:
+                self.calls["throttled"] += 1
+            raise FakeQuotaError()
+        if self.latency:
+            time.sleep(self.latency)
+        if fail:
+            with self._lock:
+                self.calls["errors"] += 1
+            raise RuntimeError("injected Gemini failure")
+        schema = config.get("response_schema", {})
+        if schema.get("type") == "ARRAY":
+            allowed = schema["items"]["properties"]["label"]["enum"]
+            parsed = [
+                {"file_id": fid, **self._answer(name.strip(), allowed)}
+                for fid, name in re.findall(r"### file_id: (\S+)\nFilename: (.*)", prompt)
+            ]
+        else:
+            allowed = schema["properties"]["label"]["enum"]
+            m = re.search(r"Filename: (.*)", prompt)
+            parsed = self._answer(m.group(1).strip() if m else "", allowed)
+        usage = SimpleNamespace(prompt_token_count=(sent + cached) // 4, cached_content_token_count=cached // 4)
+        return SimpleNamespace(parsed=parsed, text=None, usage_metadata=usage)
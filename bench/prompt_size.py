@@ -0,0 +1,122 @@
+"""Tokens sent to Gemini per file, before and after snippet selection.
+
+    python -m bench.prompt_size                         # synthetic multi-page documents
+    python -m bench.prompt_size docs/*.pdf notes/*.txt  # your own files
+    python -m bench.prompt_size --budget 800 --per-file
+
+"Before" is the old body (the first 20k characters), "after" is select_snippet's
+excerpt. The system prompt + labels prefix goes once per request (files are
+batched GEMINI_BATCH_SIZE at a time), or once in total when it is big enough
+for a context cache. Token counts are estimates at 4 chars/token.
+`keywords_kept` checks that the keyword scorer reaches the same label on the
+excerpt as on the full text.
+"""
+import argparse
+import csv
+import json
+import math
+import os
+import random
+import statistics
+
+BOILERPLATE = [
+    "ACME Holdings Ltd  ·  221B Example Street  ·  London NW1 6XE",
+    "CONFIDENTIAL - for the addressee only",
+    "This document was generated electronically and is valid without a signature.",
+]
+
+def synthetic_docs(label_keywords: dict, n: int, seed: int) -> list:
+    """(name, text) pairs: running header/footer on every page, keywords on one random page."""
+    from ai_router import parse_keywords
+    from bench.run_pipeline import _words
+    rng = random.Random(seed)
+    labels = [label for label, spec in label_keywords.items() if parse_keywords(spec)]
+    docs = []
+    for i in range(n):
+        kws = [kw for kw, _ in parse_keywords(label_keywords[rng.choice(labels)])]
+        pages = rng.choice((1, 3, 10))
+        hit_page = rng.randrange(pages)
+        text = "\n".join(
+            "\n".join([BOILERPLATE[0], BOILERPLATE[1],
+                       _words(rng, rng.sample(kws, min(2, len(kws))) if p == hit_page else [], 300),
+                       f"Page {p + 1} of {pages}", BOILERPLATE[2]])
+            for p in range(pages)
+        )
+        docs.append((f"doc_{i:04d}.pdf", text))
+    return docs
+
+def file_docs(paths: list) -> list:
+    from config import EXTRACT_MAX_CHARS, PDF_BACKEND, PDF_MAX_PAGES
+    from services.pdf_text import extract_path, pick_backend
+    docs = []
+    for path in paths:
+        if path.lower().endswith(".pdf"):
+            text, _, _ = extract_path(path, pick_backend(PDF_BACKEND), EXTRACT_MAX_CHARS, PDF_MAX_PAGES)
+        else:
+            with open(path, encoding="utf-8", errors="ignore") as f:
+                text = f.read(EXTRACT_MAX_CHARS)
+        docs.append((os.path.basename(path), text))
+    return docs
+
+def measure(docs: list, cat, budget: int) -> dict:
+    from ai_router import (
+        MAX_BODY_CHARS, BATCH_SYSTEM_PROMPT, _labels_block, heuristic_label, select_snippet,
+    )
+    from config import GEMINI_BATCH_SIZE, GEMINI_CONTEXT_CACHE, GEMINI_CACHE_MIN_TOKENS
+    prefix = len(f"{BATCH_SYSTEM_PROMPT}\n\nAllowed labels:\n{_labels_block(cat.allowed, cat.label_desc)}") // 4
+    requests = math.ceil(len(docs) / max(1, GEMINI_BATCH_SIZE))
+    cached = GEMINI_CONTEXT_CACHE and prefix >= GEMINI_CACHE_MIN_TOKENS
+    rows = []
+    for name, text in docs:
+        snippet = select_snippet(text, cat.matcher, budget)
+        full_label = heuristic_label(name, text, cat.allowed, cat.matcher)[0]
+        rows.append({
+            "file": name,
+            "before": min(len(text), MAX_BODY_CHARS) // 4,
+            "after": len(snippet) // 4,
+            "keywords_kept": heuristic_label(name, snippet, cat.allowed, cat.matcher)[0] == full_label,
+        })
+    before = [r["before"] for r in rows]
+    after = [r["after"] for r in rows]
+    total_before = sum(before) + prefix * requests
+    total_after = sum(after) + prefix * (1 if cached else requests)
+    return {
+        "files": len(rows),
+        "budget_tokens": budget,
+        "prefix_tokens": prefix,
+        "prefix_cached": cached,
+        "before": {"total": total_before, "mean_body": round(statistics.fmean(before), 1) if rows else 0,
+                   "max_body": max(before, default=0)},
+        "after": {"total": total_after, "mean_body": round(statistics.fmean(after), 1) if rows else 0,
+                  "max_body": max(after, default=0)},
+        "reduction_pct": round(100.0 * (1 - total_after / total_before), 1) if total_before else 0.0,
+        "keywords_kept_pct": round(100.0 * sum(r["keywords_kept"] for r in rows) / len(rows), 1) if rows else 0.0,
+        "per_file": rows,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="*", help="PDFs or text files (default: synthetic documents)")
+    parser.add_argument("--files", type=int, default=100, help="synthetic documents to generate")
+    parser.add_argument("--budget", type=int, help="snippet token budget (default GEMINI_SNIPPET_TOKENS)")
+    parser.add_argument("--catalog", default="folders.csv")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--per-file", action="store_true", help="include one row per file")
+    args = parser.parse_args()
+
+    import state
+    from ai_router import load_folder_catalog
+    from config import GEMINI_SNIPPET_TOKENS
+    label_to_id, label_desc, allowed = load_folder_catalog(args.catalog)
+    with open(args.catalog, newline="", encoding="utf-8") as f:
+        keywords = {row["label"].strip(): (row.get("keywords") or "").strip() for row in csv.DictReader(f)}
+    cat = state.CatalogSnapshot(label_to_id, label_desc, allowed, keywords)   # fills in default keywords
+
+    docs = file_docs(args.paths) if args.paths else synthetic_docs(dict(cat.keywords), args.files, args.seed)
+    report = measure(docs, cat, GEMINI_SNIPPET_TOKENS if args.budget is None else args.budget)
+    if not args.per_file:
+        report.pop("per_file")
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
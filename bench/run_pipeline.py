@@ -0,0 +1,342 @@
+"""Replay a synthetic workload through the full pipeline, offline.
+
+    python -m bench.run_pipeline --files 500 --latency-ms 20 --error-rate 0.01
+    python -m bench.run_pipeline --out base.json
+    python -m bench.run_pipeline --baseline base.json --tolerance 0.2
+
+Drive and Gemini are the in-process fakes from bench.fakes; everything else is
+the real code: /drive/start-watch and the webhook route via Flask's test
+client, the drainer and worker pool, content extraction (real PDFs through the
+extraction pool), the router tiers, the classification cache and batched
+moves. State (journal, cache, catalog CSV and snapshot) lives in a temp dir.
+
+Reports files/sec, p50/p95/p99 per stage, API call counts, routing accuracy
+and peak RSS as JSON. With --baseline it exits non-zero when throughput drops
+or API calls grow by more than --tolerance, so regressions fail loudly.
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+DEFAULT_MIX = ("text/plain=3,application/pdf=3,application/vnd.google-apps.document=2,"
+               "application/vnd.google-apps.spreadsheet=1,image/jpeg=1")
+FILLER = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor "
+          "incididunt ut magna aliqua enim minim veniam quis nostrud exercitation").split()
+INBOX, LABELS_ROOT = "inbox", "labels-root"
+
+# -- synthetic content --------------------------------------------------------
+
+def _pdf_escape(line: str) -> str:
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def make_pdf(pages: list) -> bytes:
+    """Smallest valid text PDF: one Helvetica text stream per page."""
+    objs = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+            "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        lines = [text[i:i + 90] for i in range(0, len(text), 90)] or [""]
+        stream = "BT /F1 10 Tf 40 800 Td 12 TL " + " ".join(f"({_pdf_escape(l)}) '" for l in lines) + " ET"
+        objs.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objs.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                    f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objs)} 0 R >>")
+        kids.append(f"{len(objs)} 0 R")
+    objs[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out, offsets = bytearray(b"%PDF-1.4\n"), []
+    for n, body in enumerate(objs, 1):
+        offsets.append(len(out))
+        out += f"{n} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objs) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{o:010d} 00000 n \n" for o in offsets).encode()
+    out += f"trailer\n<< /Size {len(objs) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+def _parse_mix(spec: str) -> list:
+    mix = []
+    for part in spec.split(","):
+        mime, _, weight = part.strip().partition("=")
+        if mime:
+            mix.append((mime, float(weight or 1)))
+    return mix
+
+def _words(rng, keywords: list, n: int) -> str:
+    words = [rng.choice(FILLER) for _ in range(n)]
+    for kw in keywords:
+        words.insert(rng.randrange(len(words) + 1), kw)
+    return " ".join(words)
+
+def build_workload(drive, label_keywords: dict, n: int, mix: list, pdf_pages: list,
+                   ambiguous: float, duplicates: float, seed: int) -> dict:
+    """Drop n files into the inbox; returns {filename: true label}.
+
+    `ambiguous` files carry no keywords, so they fall through to Gemini;
+    `duplicates` reuse an earlier file's bytes to exercise the cache.
+    """
+    from ai_router import parse_keywords
+    rng = random.Random(seed)
+    mimes, weights = zip(*mix)
+    labels = [label for label, spec in label_keywords.items() if parse_keywords(spec)]
+    truth, blobs = {}, []
+    for i in range(n):
+        mime = rng.choices(mimes, weights)[0]
+        label = rng.choice(labels)
+        kws = [kw for kw, _ in parse_keywords(label_keywords[label])]
+        hinted = rng.random() >= ambiguous
+        stem = f"{kws[0].replace(' ', '_')}_{i:05d}" if hinted else f"scan_{i:05d}"
+        body_kws = rng.sample(kws, min(3, len(kws))) if hinted else []
+
+        if mime == "application/pdf":
+            n_pages = rng.choice(pdf_pages)
+            data = make_pdf([_words(rng, body_kws if p == 0 else [], 300) for p in range(n_pages)])
+            name = stem + ".pdf"
+        elif mime.startswith("image/"):
+            data = rng.randbytes(rng.randint(20_000, 200_000))
+            name = stem + ".jpg"
+        else:
+            data = _words(rng, body_kws, rng.randint(50, 2000)).encode()
+            name = stem + (".txt" if mime.startswith("text/") else "")
+        if blobs and mime != "image/jpeg" and rng.random() < duplicates:
+            dup_mime, data, label = rng.choice(blobs)
+            mime = dup_mime
+        blobs.append((mime, data, label))
+        truth[name] = label
+        drive.add_file(name, mime, INBOX, data)
+    return truth
+
+# -- instrumentation ----------------------------------------------------------
+
+class Stages:
+    def __init__(self):
+        self.samples: dict = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def wrap(self, module, attr: str, stage: str):
+        fn = getattr(module, attr)
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - started)
+        setattr(module, attr, timed)
+
+    def report(self) -> dict:
+        out = {}
+        with self._lock:
+            for stage, xs in sorted(self.samples.items()):
+                xs = sorted(xs)
+                pct = lambda p: xs[min(len(xs) - 1, int(p / 100 * len(xs)))]
+                out[stage] = {"n": len(xs), "p50_ms": round(pct(50) * 1000, 2),
+                              "p95_ms": round(pct(95) * 1000, 2), "p99_ms": round(pct(99) * 1000, 2),
+                              "max_ms": round(xs[-1] * 1000, 2)}
+        return out
+
+def _peak_rss_mb(who) -> float:
+    kb = resource.getrusage(who).ru_maxrss
+    return round(kb / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+# -- run ----------------------------------------------------------------------
+
+def _configure_env(args, workdir: str):
+    csv_path = os.path.join(workdir, "folders.csv")
+    shutil.copy(args.catalog, csv_path)
+    os.environ.update({
+        "APP_URL": "https://bench.invalid",
+        "DRIVE_FOLDER_ID": INBOX,
+        "DRIVE_PARENT_ID": LABELS_ROOT,
+        "DRIVE_ID": "", "RESTRICT_TO_MY_DRIVE": "0", "CHANGE_FEED": "changes",
+        "FOLDER_CATALOG_CSV": csv_path,
+        "CATALOG_SNAPSHOT_FILE": os.path.join(workdir, "catalog_snapshot.json"),
+        "WATCH_ID_FILE": os.path.join(workdir, "watch_channel.json"),
+        "START_TOKEN_FILE": os.path.join(workdir, "start_page_token.txt"),
+        "JOURNAL_DB": os.path.join(workdir, "journal.sqlite3"),
+        "CLASSIFY_CACHE_DB": os.path.join(workdir, "cache.sqlite3"),
+        "LOCAL_MODEL_PATH": os.path.join(workdir, "local_model.npz"),
+        "GEMINI_API_KEY": "bench",
+        "WORKER_CONCURRENCY": str(args.workers),
+    })
+    # pacing knobs default to bench-friendly values unless set by the caller
+    # (client-side rate limits start high and only adapt to the fakes' --*-quota-qps)
+    for key, value in {"DRAIN_DEBOUNCE_SECONDS": "0", "RETRY_BACKOFF_BASE": "0.05",
+                       "MOVE_BATCH_WAIT": "0.2", "GEMINI_BATCH_WAIT": "0.05",
+                       "DRIVE_READ_QPS": "1000", "DRIVE_WRITE_QPS": "1000", "GEMINI_QPS": "1000"}.items():
+        os.environ.setdefault(key, value)
+    return csv_path
+
+def _install(drive, gemini):
+    """Point every get_drive import and the Gemini client factory at the fakes."""
+    import ai_router
+    for name, module in list(sys.modules.items()):
+        if (name == "app" or name.startswith("services.")) and hasattr(module, "get_drive"):
+            module.get_drive = lambda: drive
+        if name.startswith("services.") and hasattr(module, "get_http"):
+            module.get_http = lambda: drive.thumbnail_http
+    ai_router.get_gemini_client = lambda api_key: gemini
+    if ai_router.genai is None:
+        ai_router.genai = object()   # routing only checks that the SDK imported
+
+def run(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="folderheist-bench-")
+    try:
+        _configure_env(args, workdir)
+        from bench.fakes import FakeDrive, FakeGenai
+        from app import app
+        from services import worker, processing, content, moves, journal
+        from services.moves import move_stats
+        from services.labels import catalog
+        from ai_router import GEMINI_STATS
+
+        drive = FakeDrive(latency=args.latency_ms / 1000, error_rate=args.error_rate,
+                          error_status=args.error_status, quota_qps=args.drive_quota_qps, seed=args.seed)
+        truth: dict = {}
+        gemini = FakeGenai(latency=args.gemini_latency_ms / 1000, error_rate=args.gemini_error_rate,
+                           truth=truth, quota_qps=args.gemini_quota_qps, seed=args.seed)
+        _install(drive, gemini)
+
+        stages = Stages()
+        stages.wrap(worker, "drain_changes", "drain")
+        stages.wrap(worker, "process_file", "process")
+        stages.wrap(processing, "read_text", "read")
+        stages.wrap(processing, "choose_folder_with_gemini", "classify")
+        stages.wrap(content, "extract_pdf_text", "pdf_extract")
+        stages.wrap(moves, "move_batch", "move_batch")
+
+        client = app.test_client()
+        started = time.perf_counter()
+        channel = client.post("/drive/start-watch").get_json()["channel"]
+        stages.record("start_watch", time.perf_counter() - started)
+
+        label_keywords = dict(catalog().keywords)
+        truth.update(build_workload(drive, label_keywords, args.files, _parse_mix(args.mix),
+                                    [int(p) for p in args.pdf_pages.split(",")],
+                                    args.ambiguous, args.duplicates, args.seed))
+        calls_before = dict(drive.calls)
+
+        finished = threading.Event()
+        done_at: dict = {}
+
+        def _on_move(file_meta, ok):
+            done_at[file_meta["id"]] = time.perf_counter()
+        moves.on_move_finished(_on_move)
+
+        started = time.perf_counter()
+        headers = {"X-Goog-Channel-ID": channel["id"], "X-Goog-Resource-ID": channel["resourceId"],
+                   "X-Goog-Channel-Token": channel["token"], "X-Goog-Resource-State": "change"}
+        for _ in range(args.notifications):
+            client.post(os.environ.get("WEBHOOK_ENDPOINT", "/drive/notifications"), headers=headers)
+
+        deadline = started + args.timeout
+        while time.perf_counter() < deadline:
+            stats = worker.queue_stats()
+            items = journal.journal_stats()["items"]
+            if (stats["enqueued"] >= args.files and not items.get("pending")
+                    and stats["queue_depth"] == 0 and stats["in_flight"] == 0):
+                finished.set()
+                break
+            time.sleep(0.02)
+        elapsed = time.perf_counter() - started
+        for fid, t in done_at.items():
+            stages.record("end_to_end", t - started)
+
+        cat = catalog()
+        by_folder = {fid: label for label, fid in cat.label_to_id.items()}
+        routed = {f["name"]: by_folder.get(p) for f in drive.store.values()
+                  for p in f["parents"] if f["name"] in truth}
+        correct = sum(1 for name, label in routed.items() if label == truth[name])
+        stats = worker.queue_stats()
+        calls = {k: v - calls_before.get(k, 0) for k, v in sorted(drive.calls.items())
+                 if v > calls_before.get(k, 0)}
+
+        return {
+            "config": {k: v for k, v in vars(args).items() if k not in ("baseline", "out")},
+            "completed": finished.is_set(),
+            "seconds": round(elapsed, 3),
+            "files": args.files,
+            "files_per_sec": round(args.files / elapsed, 2) if elapsed else 0.0,
+            "processed": stats["processed"], "retried": stats["retried"], "failed": stats["failed"],
+            "requeued": stats.get("requeued", 0),
+            "accuracy": round(correct / len(truth), 4) if truth else 0.0,
+            "stages": stages.report(),
+            "drive_calls": calls,
+            "drive_calls_total": sum(v for k, v in calls.items() if k not in ("errors", "throttled") and "[batched]" not in k),
+            "drive_bytes": dict(drive.bytes_served),
+            "gemini_calls": dict(gemini.calls),
+            "gemini_stats": dict(GEMINI_STATS),
+            "moves": move_stats(),
+            "peak_rss_mb": _peak_rss_mb(resource.RUSAGE_SELF),
+            "peak_rss_children_mb": _peak_rss_mb(resource.RUSAGE_CHILDREN),
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def check_regression(report: dict, baseline: dict, tolerance: float) -> list:
+    """Compare per-file rates, so runs of different sizes stay comparable."""
+    problems = []
+    if report["files_per_sec"] < baseline["files_per_sec"] * (1 - tolerance):
+        problems.append(f"files/sec {report['files_per_sec']} < baseline {baseline['files_per_sec']}")
+    for name, get in (("drive calls", lambda r: r["drive_calls_total"]),
+                      ("gemini calls", lambda r: r["gemini_calls"].get("generate_content", 0))):
+        now, base = get(report) / report["files"], get(baseline) / baseline["files"]
+        if now > base * (1 + tolerance) + 1e-9:
+            problems.append(f"{name} per file {now:.3f} > baseline {base:.3f}")
+    if report["accuracy"] < baseline["accuracy"] - tolerance / 10:
+        problems.append(f"accuracy {report['accuracy']} < baseline {baseline['accuracy']}")
+    if not report["completed"]:
+        problems.append("run did not finish before --timeout")
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="mime=weight,... for generated files")
+    parser.add_argument("--pdf-pages", default="1,3,10", help="page counts PDFs are drawn from")
+    parser.add_argument("--ambiguous", type=float, default=0.3, help="share of files with no keywords")
+    parser.add_argument("--duplicates", type=float, default=0.1, help="share of files reusing earlier bytes")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--notifications", type=int, default=5, help="webhook posts (a burst)")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="mean Drive call latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Drive calls failing with --error-status")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--drive-quota-qps", type=float, default=0.0, help="Drive answers 429 above this rate")
+    parser.add_argument("--gemini-quota-qps", type=float, default=0.0, help="Gemini answers 429 above this rate")
+    parser.add_argument("--gemini-latency-ms", type=float, default=0.0)
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    parser.add_argument("--catalog", default="folders.csv", help="label catalog to route against")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--verbose", action="store_true", help="keep the pipeline's own log lines")
+    parser.add_argument("--out", help="write the report here as well")
+    parser.add_argument("--baseline", help="earlier report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(sys.stdout if args.verbose else open(os.devnull, "w")):
+        report = run(args)
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = check_regression(report, json.load(f), args.tolerance)
+        for p in problems:
+            print(f"[BENCH] Regression: {p}", file=sys.stderr)
+        sys.exit(1 if problems else 0)
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,16 @@ PORT = int(os.getenv("PORT", "8080"))
 SCOPES = [os.getenv("SCOPES", "https://www.googleapis.com/auth/drive")]
 DRIVE_FOLDER_ID = os.getenv("DRIVE_FOLDER_ID", "")           # watched folder (incoming)
 DRIVE_PARENT_ID = os.getenv("DRIVE_PARENT_ID", "")           # parent where label folders live
+DRIVE_ID = os.getenv("DRIVE_ID", "")                         # shared drive holding the watched folder, if any
+RESTRICT_TO_MY_DRIVE = os.getenv("RESTRICT_TO_MY_DRIVE", "0") == "1"
+CHANGE_FEED = os.getenv("CHANGE_FEED", "changes")            # changes | folder (poll files().list of DRIVE_FOLDER_ID)
+FEED_PAGE_SIZE = int(os.getenv("FEED_PAGE_SIZE", "1000"))
+FOLDER_POLL_SECONDS = float(os.getenv("FOLDER_POLL_SECONDS", "60"))
+# The folder poll filters on modifiedTime, so it misses files moved in (or uploaded with an
+# older, preserved modifiedTime) after its checkpoint; a full listing every interval catches them
+FOLDER_SWEEP_SECONDS = float(os.getenv("FOLDER_SWEEP_SECONDS", "3600"))
+TOKEN_REFRESH_MARGIN_SECONDS = int(os.getenv("TOKEN_REFRESH_MARGIN_SECONDS", "300"))
+DRIVE_HTTP_TIMEOUT = float(os.getenv("DRIVE_HTTP_TIMEOUT", "60"))
 
 # Files
 WATCH_ID_FILE = os.getenv("WATCH_ID_FILE", "watch_channel.json")
@@ -19,9 +29,88 @@ TOKEN_FILE = os.getenv("TOKEN_FILE", "token.json")
 CLIENT_SECRET_FILE = os.getenv("CLIENT_SECRET_FILE", "client_secret.json")
 START_TOKEN_FILE = os.getenv("START_TOKEN_FILE", "start_page_token.txt")
 FOLDER_CATALOG_CSV = os.getenv("FOLDER_CATALOG_CSV", "folders.csv")
+CATALOG_SNAPSHOT_FILE = os.getenv("CATALOG_SNAPSHOT_FILE", "catalog_snapshot.json")  # shared by all worker processes; "" disables
+CATALOG_RELOAD_INTERVAL = float(os.getenv("CATALOG_RELOAD_INTERVAL", "5"))          # seconds between snapshot-file checks
 
 # Router
 CONF_THRESHOLD = float(os.getenv("ROUTER_CONF_THRESHOLD", "0.55"))
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+GEMINI_BATCH_SIZE = int(os.getenv("GEMINI_BATCH_SIZE", "8"))                 # files per request; 1 = no batching
+GEMINI_BATCH_WAIT = float(os.getenv("GEMINI_BATCH_WAIT", "0.5"))             # seconds to wait for a batch to fill
+GEMINI_BATCH_TOKEN_BUDGET = int(os.getenv("GEMINI_BATCH_TOKEN_BUDGET", "30000"))
+GEMINI_BATCH_CONCURRENCY = int(os.getenv("GEMINI_BATCH_CONCURRENCY", "2"))   # batch requests in flight
+GEMINI_BATCH_TIMEOUT = float(os.getenv("GEMINI_BATCH_TIMEOUT", "300"))       # a worker gives up on its batch (and retries) after this
+GEMINI_SNIPPET_TOKENS = int(os.getenv("GEMINI_SNIPPET_TOKENS", "1200"))      # body budget per file (~4 chars/token); 0 = first 20k chars
+GEMINI_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "1") == "1"         # explicit cache for the labels prefix when big enough
+GEMINI_CACHE_MIN_TOKENS = int(os.getenv("GEMINI_CACHE_MIN_TOKENS", "1024"))  # the API rejects smaller caches
+GEMINI_CACHE_TTL_SECONDS = int(os.getenv("GEMINI_CACHE_TTL_SECONDS", "3600"))
+LOCAL_MODEL_PATH = os.getenv("LOCAL_MODEL_PATH", "local_model.npz")
+LOCAL_MODEL_MAX_PER_LABEL = int(os.getenv("LOCAL_MODEL_MAX_PER_LABEL", "200"))  # training files read per folder
+
+# Content extraction
+EXTRACT_MAX_CHARS = int(os.getenv("EXTRACT_MAX_CHARS", "20000"))               # router only reads this much
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", str(1024 * 1024)))
+SPOOL_MAX_MEMORY = int(os.getenv("SPOOL_MAX_MEMORY", str(8 * 1024 * 1024)))    # larger bodies spill to a temp file
+PDF_MAX_BYTES = int(os.getenv("PDF_MAX_BYTES", str(50 * 1024 * 1024)))         # bigger PDFs route by name only
+PDF_BACKEND = os.getenv("PDF_BACKEND", "auto")              # auto | pypdfium2 | pdfminer | pypdf2
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "10"))       # 0 = no page cap, chars still apply
+PDF_PROCESS_WORKERS = int(os.getenv("PDF_PROCESS_WORKERS", "2"))  # 0 = extract inline
+PDF_TIMEOUT = float(os.getenv("PDF_TIMEOUT", "60"))
+
+# Photos and scans: route from Drive's thumbnail rendition, never the original
+MEDIA_PREVIEW = os.getenv("MEDIA_PREVIEW", "1") == "1"
+MEDIA_PREVIEW_PX = int(os.getenv("MEDIA_PREVIEW_PX", "512"))                      # longest side sent to Gemini
+MEDIA_PREVIEW_MAX_BYTES = int(os.getenv("MEDIA_PREVIEW_MAX_BYTES", str(256 * 1024)))
+MEDIA_OCR = os.getenv("MEDIA_OCR", "auto")                  # auto (if pytesseract + Pillow are installed) | off
+MEDIA_OCR_PX = int(os.getenv("MEDIA_OCR_PX", "1600"))
+MEDIA_SCAN_MIN_CHARS = int(os.getenv("MEDIA_SCAN_MIN_CHARS", "40"))   # PDFs with less text than this count as scans
+
+# Classification cache (content hash -> label)
+CLASSIFY_CACHE_DB = os.getenv("CLASSIFY_CACHE_DB", "classify_cache.sqlite3")
+CLASSIFY_CACHE_TTL_DAYS = float(os.getenv("CLASSIFY_CACHE_TTL_DAYS", "90"))
+CLASSIFY_CACHE_MAX_ENTRIES = int(os.getenv("CLASSIFY_CACHE_MAX_ENTRIES", "50000"))
+
+# Worker pool
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "4"))
+QUEUE_MAXSIZE = int(os.getenv("QUEUE_MAXSIZE", "200"))             # enqueue blocks when full (backpressure)
+PROCESS_MAX_RETRIES = int(os.getenv("PROCESS_MAX_RETRIES", "3"))
+RETRY_BACKOFF_BASE = float(os.getenv("RETRY_BACKOFF_BASE", "2.0"))  # seconds, doubled per attempt
+DRAIN_DEBOUNCE_SECONDS = float(os.getenv("DRAIN_DEBOUNCE_SECONDS", "2.0"))  # quiet period that ends a burst
+DRAIN_MAX_DELAY = float(os.getenv("DRAIN_MAX_DELAY", "15.0"))              # never hold a drain back longer than this
+
+# Watch channels
+WATCH_TTL_SECONDS = int(os.getenv("WATCH_TTL_SECONDS", "86400"))                  # requested lifetime; Drive caps changes channels at 7 days
+WATCH_RENEW_BEFORE_SECONDS = int(os.getenv("WATCH_RENEW_BEFORE_SECONDS", "3600"))  # open the replacement this long before expiry
+WATCH_OVERLAP_SECONDS = int(os.getenv("WATCH_OVERLAP_SECONDS", "120"))            # old channel stays up this long after
+WATCH_CHECK_SECONDS = float(os.getenv("WATCH_CHECK_SECONDS", "60"))
+
+# Change-feed journal
+JOURNAL_DB = os.getenv("JOURNAL_DB", "change_journal.sqlite3")
+JOURNAL_LEASE_SECONDS = float(os.getenv("JOURNAL_LEASE_SECONDS", "120"))
+JOURNAL_CLAIM_SECONDS = float(os.getenv("JOURNAL_CLAIM_SECONDS", "300"))   # a dead process's pending items are replayed after this
+JOURNAL_RETENTION_DAYS = float(os.getenv("JOURNAL_RETENTION_DAYS", "7"))
+
+# Batched moves
+MOVE_BATCH_SIZE = min(int(os.getenv("MOVE_BATCH_SIZE", "50")), 100)  # Drive caps batches at 100 calls
+MOVE_BATCH_WAIT = float(os.getenv("MOVE_BATCH_WAIT", "2.0"))        # max seconds a move waits for a batch
+MOVE_MAX_RETRIES = int(os.getenv("MOVE_MAX_RETRIES", "3"))
+
+# Backfill (python backfill.py / POST /drive/backfill)
+BACKFILL_CONCURRENCY = int(os.getenv("BACKFILL_CONCURRENCY", "8"))   # files in flight; Gemini micro-batches fill from these
+BACKFILL_MAX_CONCURRENCY = int(os.getenv("BACKFILL_MAX_CONCURRENCY", "64"))   # cap on ?concurrency= for HTTP runs
+BACKFILL_MAX_PASSES = int(os.getenv("BACKFILL_MAX_PASSES", "3"))     # re-list passes while moves shift the listing
+BACKFILL_REPORT_DIR = os.getenv("BACKFILL_REPORT_DIR", "backfill_reports")
+
+# Quotas: per-process token buckets, halved on 429 and recovering over a few seconds; 0 = unlimited
+DRIVE_READ_QPS = float(os.getenv("DRIVE_READ_QPS", "50"))
+DRIVE_WRITE_QPS = float(os.getenv("DRIVE_WRITE_QPS", "10"))   # batch requests cost one token per inner call
+GEMINI_QPS = float(os.getenv("GEMINI_QPS", "2"))
+QUOTA_MAX_RETRIES = int(os.getenv("QUOTA_MAX_RETRIES", "5"))    # in-call retries before the file is requeued
+QUOTA_BACKOFF_MAX = float(os.getenv("QUOTA_BACKOFF_MAX", "60"))  # seconds
+
+# Observability
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")               # json (one object per line) | text
 
 # Misc
 FOLDER_MIME = "application/vnd.google-apps.folder"
@@ -0,0 +1,173 @@
+import os, re, threading, time, zlib
+from typing import Dict, List
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+from services.logs import get_logger
+
+log = get_logger("model")
+
+# Local CPU-only routing tier: hashed bag-of-words, TF-IDF weighted nearest
+# centroid. Training only accumulates per-label term sums and document
+# frequencies, so new examples can be added incrementally at any time.
+
+N_FEATURES = 2 ** 17
+TEMPERATURE = 0.1        # softmax temperature over cosine similarities
+MIN_SIMILARITY = 0.2     # below this the winner is discounted: "closest" is not "close"
+_TOKEN = re.compile(r"[a-z0-9]{2,}")
+
+def _features(filename: str, text: str):
+    """Hashed, sublinear term counts as (indices, values); filename tokens count double."""
+    tokens = _TOKEN.findall(f"{filename} {filename} {text or ''}".lower().replace("_", " "))
+    if not tokens:
+        return None, None
+    hashed = np.fromiter((zlib.crc32(t.encode()) for t in tokens), dtype=np.uint32, count=len(tokens))
+    idx, counts = np.unique(hashed % N_FEATURES, return_counts=True)
+    return idx, 1.0 + np.log(counts.astype(np.float32))
+
+class LocalModel:
+    def __init__(self):
+        self.labels: List[str] = []
+        self.term_sums = np.zeros((0, N_FEATURES), dtype=np.float32)
+        self.doc_counts = np.zeros(0, dtype=np.int64)
+        self.df = np.zeros(N_FEATURES, dtype=np.float32)
+        self.n_docs = 0
+        self.seen: set = set()
+        self._weights = None   # idf-weighted, row-normalised centroids; rebuilt lazily
+        self._lock = threading.Lock()
+
+    def _row(self, label: str) -> int:
+        if label not in self.labels:
+            self.labels.append(label)
+            self.term_sums = np.vstack([self.term_sums, np.zeros((1, N_FEATURES), dtype=np.float32)])
+            self.doc_counts = np.append(self.doc_counts, 0)
+        return self.labels.index(label)
+
+    def add(self, label: str, filename: str, text: str, doc_id: str | None = None) -> bool:
+        if doc_id and doc_id in self.seen:
+            return False
+        idx, vals = _features(filename, text)
+        if idx is None:
+            return False
+        with self._lock:
+            row = self._row(label)
+            self.term_sums[row, idx] += vals / np.linalg.norm(vals)
+            self.doc_counts[row] += 1
+            self.df[idx] += 1
+            self.n_docs += 1
+            if doc_id:
+                self.seen.add(doc_id)
+            self._weights = None
+        return True
+
+    def _centroids(self):
+        if self._weights is None:
+            idf = np.log((1.0 + self.n_docs) / (1.0 + self.df)) + 1.0
+            w = self.term_sums * idf
+            norms = np.linalg.norm(w, axis=1, keepdims=True)
+            self._weights = (w / np.maximum(norms, 1e-9), idf)
+        return self._weights
+
+    def predict(self, filename: str, text: str, allowed: List[str]) -> tuple[str, float, str] | None:
+        idx, vals = _features(filename, text)
+        with self._lock:
+            rows = [i for i, lab in enumerate(self.labels) if lab in allowed and self.doc_counts[i] > 0]
+            if idx is None or len(rows) < 2:
+                return None
+            weights, idf = self._centroids()
+        x = vals * idf[idx]
+        sims = weights[:, idx][rows] @ (x / np.linalg.norm(x))
+        probs = np.exp((sims - sims.max()) / TEMPERATURE)
+        probs /= probs.sum()
+        best = int(np.argmax(probs))
+        label = self.labels[rows[best]]
+        conf = float(probs[best]) * min(1.0, max(float(sims[best]), 0.0) / MIN_SIMILARITY)
+        return label, round(conf, 3), f"Local model cos={float(sims[best]):.2f}"
+
+    def save(self, path: str):
+        with self._lock:
+            tmp = path + ".tmp.npz"
+            np.savez_compressed(
+                tmp, labels=np.array(self.labels, dtype=str), term_sums=self.term_sums,
+                doc_counts=self.doc_counts, df=self.df, n_docs=np.array(self.n_docs),
+                seen=np.array(sorted(self.seen), dtype=str),
+            )
+            os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "LocalModel":
+        model = cls()
+        with np.load(path) as data:
+            model.labels = [str(x) for x in data["labels"]]
+            model.term_sums = data["term_sums"].astype(np.float32)
+            model.doc_counts = data["doc_counts"]
+            model.df = data["df"]
+            model.n_docs = int(data["n_docs"])
+            model.seen = {str(x) for x in data["seen"]}
+        return model
+
+    def summary(self) -> Dict:
+        return {
+            "documents": self.n_docs,
+            "per_label": {lab: int(n) for lab, n in zip(self.labels, self.doc_counts)},
+        }
+
+# The live model is swapped, never trained in place: refreshes train a private
+# copy, save it and publish it; every process notices the new file's mtime
+# (checked at most every RELOAD_CHECK_SECONDS) and reloads it.
+RELOAD_CHECK_SECONDS = 5.0
+_model = None
+_model_mtime = None    # st_mtime_ns of the file _model came from
+_checked_at = 0.0
+_model_lock = threading.Lock()
+
+def _mtime(path: str | None):
+    try:
+        return os.stat(path).st_mtime_ns if path else None
+    except OSError:
+        return None
+
+def get_local_model(path: str | None = None) -> LocalModel | None:
+    """Process-wide model from `path`, reloaded when the file changes; None when NumPy is missing."""
+    global _model, _model_mtime, _checked_at
+    if np is None:
+        return None
+    with _model_lock:
+        now = time.monotonic()
+        if _model is not None and now - _checked_at < RELOAD_CHECK_SECONDS:
+            return _model
+        _checked_at = now
+        mtime = _mtime(path)
+        if mtime is None or mtime == _model_mtime:
+            if _model is None:
+                _model = LocalModel()
+            return _model
+    try:
+        loaded = LocalModel.load(path)   # outside the lock: predictions keep using the old model
+    except Exception as e:
+        log.warning("Could not load local model", path=path, error=str(e))
+        loaded = None
+    with _model_lock:
+        if loaded is not None:
+            _model, _model_mtime = loaded, mtime
+            log.info("Loaded local model", path=path, documents=loaded.n_docs)
+        elif _model is None:
+            _model = LocalModel()
+        return _model
+
+def training_model(path: str, full: bool = False) -> LocalModel | None:
+    """A private model to train: empty for a full retrain, else a copy of the saved one."""
+    if np is None:
+        return None
+    if full or _mtime(path) is None:
+        return LocalModel()
+    return LocalModel.load(path)
+
+def publish_local_model(model: LocalModel, path: str):
+    """Save a trained model and make it this process's live model in one swap."""
+    global _model, _model_mtime
+    model.save(path)
+    with _model_lock:
+        _model, _model_mtime = model, _mtime(path)
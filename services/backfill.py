@@ -0,0 +1,259 @@
+import json
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from config import (
+    DRIVE_FOLDER_ID, BACKFILL_CONCURRENCY, BACKFILL_REPORT_DIR, BACKFILL_MAX_PASSES,
+    PROCESS_MAX_RETRIES, JOURNAL_LEASE_SECONDS,
+)
+from .drive_client import get_drive
+from .feeds import iter_children_pages
+from .labels import catalog, ensure_catalog
+from .processing import process_file
+from .worker import should_process
+from . import journal, metrics, quota
+from .logs import get_logger
+from ai_router import add_batch_callers
+
+# Backfill / bulk reorganize: list DRIVE_FOLDER_ID (plus every label folder with
+# reorganize=True) page by page and run each file through process_file on a
+# dedicated pool, next to the webhook pipeline rather than through its queue.
+#
+# Progress is journaled under the run name: the checkpoint (pass, folder, page
+# token) commits with each page's items, finished items are never redone, and
+# rerunning the same run resumes it. The default run name includes the catalog
+# version, so a changed folders.csv starts a fresh run over everything.
+#
+# Moving files out of a folder while paging through it can shift later pages,
+# so a moving run re-lists until a pass finds nothing new (BACKFILL_MAX_PASSES).
+# Every decision goes to a JSONL routing report; dry runs only write the report.
+
+log = get_logger("backfill")
+
+_lock = threading.Lock()
+_status: dict = {}   # latest run in this process, for GET /drive/backfill
+
+def default_run(dry_run: bool, reorganize: bool) -> str:
+    return f"{'dry' if dry_run else 'move'}-{'all' if reorganize else 'inbox'}-{catalog().version[:12]}"
+
+def report_path(run: str) -> str:
+    return os.path.join(BACKFILL_REPORT_DIR, f"{run}.jsonl")
+
+def _scope(reorganize: bool) -> list:
+    folders = [DRIVE_FOLDER_ID] if DRIVE_FOLDER_ID else []
+    if reorganize:
+        folders += sorted(catalog().folder_ids)
+    return folders
+
+def _iter_pages(drive, folders: list, state: dict):
+    """(items, next state) across all folders and passes, starting from `state`."""
+    while not state.get("done"):
+        if state["folder"] >= len(folders):
+            last_pass = state["fresh"] == 0 or state["pass"] + 1 >= state["max_passes"]
+            if last_pass:
+                yield [], {**state, "done": True}
+                return
+            state = {**state, "pass": state["pass"] + 1, "folder": 0, "page_token": None, "fresh": 0}
+            continue
+        pages = iter_children_pages(drive, folders[state["folder"]], state["page_token"])
+        for items, token in pages:
+            if token:
+                nxt = {**state, "page_token": token}
+            else:
+                nxt = {**state, "folder": state["folder"] + 1, "page_token": None}
+            yield items, nxt
+            state = nxt
+
+class _Report:
+    """Append-only JSONL routing report plus per-action counts for this session."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._f = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+        self.counts = Counter()
+
+    def write(self, row: dict):
+        line = json.dumps(row) + "\n"
+        with self._lock:
+            self._f.write(line)
+            self._f.flush()
+            self.counts[row["action"]] += 1
+
+    def close(self):
+        self._f.close()
+
+def _handle(file: dict, key: tuple, dry_run: bool, report: _Report):
+    parents = file.get("parents") or []
+    row = {"file_id": file["id"], "name": file.get("name", ""), "mime": file.get("mimeType", ""), "from": parents}
+    throttles = attempt = 0
+    while True:
+        try:
+            if not dry_run:
+                file["_journal"] = list(key)   # the move stage marks it done
+            decision = process_file(get_drive(), file, move=not dry_run)
+            break
+        except Exception as e:
+            if quota.is_throttle(e):
+                throttles += 1
+                time.sleep(quota.backoff(min(throttles, 10), e))
+                continue
+            if attempt < PROCESS_MAX_RETRIES:
+                time.sleep(quota.backoff(attempt, e))
+                attempt += 1
+                continue
+            log.error("Backfill failed for file", file_id=file["id"], error=str(e))
+            journal.mark(key, "failed")
+            report.write({**row, "action": "failed", "error": str(e)})
+            return
+
+    if decision is None:
+        action = "skip"
+    elif decision["folder_id"] in parents:
+        action = "in_place"
+    else:
+        action = "move"
+    if dry_run or action != "move":
+        journal.mark(key, "done")
+    metrics.inc("folderheist_backfill_files_total", action=action, dry_run=str(dry_run).lower())
+    report.write({**row, **(decision or {}), "action": action})
+
+def run_backfill(run: str | None = None, dry_run: bool = False, reorganize: bool = False,
+                 concurrency: int = BACKFILL_CONCURRENCY) -> dict:
+    """Route every file already in scope; blocks until done (moves included) and returns the status."""
+    drive = get_drive()
+    ensure_catalog(drive)
+    run = run or default_run(dry_run, reorganize)
+    if not journal.acquire_lease("backfill"):
+        raise RuntimeError("Another backfill holds the lease")
+
+    folders = _scope(reorganize)
+    report = _Report(report_path(run))
+    counts = report.counts
+    started = time.monotonic()
+    status = {"run": run, "dry_run": dry_run, "reorganize": reorganize, "state": "running",
+              "folders": len(folders), "report": report_path(run), "counts": counts,
+              "started_at": time.time()}
+    with _lock:
+        _status.clear()
+        _status.update(status)
+
+    ckey = f"backfill:{run}"
+    saved = journal.checkpoint(ckey)
+    state = json.loads(saved) if saved else {"pass": 0, "folder": 0, "page_token": None, "fresh": 0}
+    state["max_passes"] = 1 if dry_run else max(1, BACKFILL_MAX_PASSES)
+    if saved:
+        log.info("Resuming backfill", run=run, **{k: v for k, v in state.items() if k != "page_token"})
+
+    slots = threading.BoundedSemaphore(max(1, concurrency) * 2)   # bounded in-flight work, not a growing backlog
+    renewed = time.monotonic()
+    last_log = time.monotonic()
+
+    def submit(pool, file, key):
+        nonlocal renewed, last_log
+        slots.acquire()
+        fut = pool.submit(_handle, file, key, dry_run, report)
+        fut.add_done_callback(lambda _: slots.release())
+        now = time.monotonic()
+        if now - renewed > JOURNAL_LEASE_SECONDS / 3:
+            journal.acquire_lease("backfill")
+            renewed = now
+        if now - last_log > 30:
+            log.info("Backfill progress", run=run, **counts, files_per_hour=_rate(counts, started))
+            last_log = now
+
+    add_batch_callers(max(1, concurrency))
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="backfill") as pool:
+            # items a crashed run recorded but never finished
+            for file, key in journal.claim_lapsed(run):
+                submit(pool, file, key)
+            for items, nxt in _iter_pages(drive, folders, state):
+                accepted = [(file, ckey) for file, _ in items if should_process(file, folders)]
+                fresh = journal.commit_page(accepted, json.dumps(nxt), key=ckey)
+                if fresh:
+                    # the generator continues from this same dict, so the next pass sees the count
+                    nxt["fresh"] += len(fresh)
+                    journal.set_checkpoint(json.dumps(nxt), ckey)
+                state = nxt
+                for file, key in fresh:
+                    submit(pool, file, key)
+        if not dry_run:
+            _wait_for_moves(run)
+        journal.set_checkpoint(json.dumps(state), ckey)
+        status["state"] = "done"
+    except Exception as e:
+        status["state"] = "failed"
+        status["error"] = str(e)
+        raise
+    finally:
+        add_batch_callers(-max(1, concurrency))
+        report.close()
+        journal.release_lease("backfill")
+        status.update(seconds=round(time.monotonic() - started, 1), files_per_hour=_rate(counts, started),
+                      counts=dict(counts), journal=journal.run_stats(run), summary=summarize(report_path(run)))
+        with _lock:
+            _status.update(status)
+        log.info("Backfill finished", run=run, state=status["state"], **status["counts"])
+    return status
+
+def _rate(counts: Counter, started: float) -> float:
+    return round(sum(counts.values()) * 3600 / max(time.monotonic() - started, 1e-9))
+
+def _wait_for_moves(run: str):
+    # routed items stay pending until the move stage reports back
+    while journal.run_stats(run).get("pending"):
+        time.sleep(0.5)
+
+def summarize(path: str) -> dict:
+    """Routing report totals: actions, target labels, sources and folder-to-label moves."""
+    cat = catalog()
+    names = {fid: label for label, fid in cat.label_to_id.items()}
+    names[DRIVE_FOLDER_ID] = "(inbox)"
+    actions, labels, sources, moves = Counter(), Counter(), Counter(), Counter()
+    latest = {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                row = json.loads(line)
+                latest[row["file_id"]] = row   # a resumed file's last decision wins
+    except FileNotFoundError:
+        pass
+    for row in latest.values():
+        actions[row["action"]] += 1
+        if row.get("label"):
+            labels[row["label"]] += 1
+            sources[row["source"]] += 1
+        if row["action"] == "move":
+            src = next((names[p] for p in row["from"] if p in names), "(other)")
+            moves[f"{src} -> {row['label']}"] += 1
+    return {"files": len(latest), "actions": dict(actions), "labels": dict(labels),
+            "sources": dict(sources), "moves": dict(moves.most_common())}
+
+def start_backfill(**opts) -> bool:
+    """Run a backfill on a background thread; False if one is already running here."""
+    with _lock:
+        if _status.get("state") == "running":
+            return False
+        _status.clear()
+        _status["state"] = "running"
+
+    def _target():
+        try:
+            run_backfill(**opts)
+        except Exception as e:
+            log.error("Backfill failed", error=str(e))
+            with _lock:
+                _status.update(state="failed", error=str(e))
+
+    threading.Thread(target=_target, name="backfill-runner", daemon=True).start()
+    return True
+
+def backfill_status() -> dict:
+    with _lock:
+        status = dict(_status)
+    if "counts" in status:
+        status["counts"] = dict(status["counts"])
+    return status or {"state": "idle"}
@@ -0,0 +1,167 @@
+import secrets
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from config import (
+    APP_URL, WEBHOOK_ENDPOINT, WATCH_TTL_SECONDS, WATCH_RENEW_BEFORE_SECONDS,
+    WATCH_OVERLAP_SECONDS, WATCH_CHECK_SECONDS,
+)
+from .drive_client import get_drive, read_start_page_token, save_watch_info, load_watch_info, change_scope
+from .worker import request_catch_up
+from . import journal, quota
+from .logs import get_logger
+
+# Watch-channel lifecycle. WATCH_ID_FILE holds every live channel:
+#
+#   {"channels": [{"id", "resourceId", "token", "expiration", ...}, ...]}
+#
+# A scheduler thread (one per deployment, via the "watch" journal lease) opens
+# a replacement WATCH_RENEW_BEFORE_SECONDS ahead of expiry, keeps both for
+# WATCH_OVERLAP_SECONDS so no notification falls in a gap, then stops the old
+# one. The webhook accepts any listed channel. If every channel has lapsed
+# (process down, renewals failing) the next tick re-registers and requests a
+# catch-up drain from the journal's page token, which feeds the bounded queue
+# page by page instead of all at once.
+
+log = get_logger("watch")
+
+_lock = threading.Lock()
+_scheduler = None
+WATCH_STATS = {"registered": 0, "renewed": 0, "stopped": 0, "lapsed": 0, "renew_errors": 0, "rejected": 0}
+
+def _bump(key: str):
+    with _lock:
+        WATCH_STATS[key] += 1
+
+def _expires_at(channel: dict) -> float:
+    exp = channel.get("expiration")
+    return int(exp) / 1000 if exp else float("inf")
+
+def load_channels() -> list:
+    info = load_watch_info() or {}
+    if "channels" in info:
+        return info["channels"]
+    return [info] if info.get("id") else []   # single-channel file from older versions
+
+def save_channels(channels: list):
+    save_watch_info({"channels": channels})
+
+def is_known(channel_id: str | None, resource_id: str | None, token: str | None) -> bool:
+    """True for a notification from any channel we currently hold."""
+    now = time.time()
+    ok = any(
+        ch["id"] == channel_id and ch.get("resourceId") == resource_id and _expires_at(ch) > now
+        and (not ch.get("token") or secrets.compare_digest(ch["token"], token or ""))
+        for ch in load_channels()
+    )
+    if not ok:
+        _bump("rejected")
+    return ok
+
+def register_channel(drive) -> dict:
+    """Open one more changes().watch channel; existing ones stay until retired."""
+    channel_id = str(uuid.uuid4())
+    token = secrets.token_urlsafe(24)
+    address = f"{APP_URL}{WEBHOOK_ENDPOINT}"
+    body = {
+        "id": channel_id, "type": "web_hook", "address": address, "token": token,
+        "expiration": int((time.time() + WATCH_TTL_SECONDS) * 1000),
+    }
+    resp = quota.execute(drive.changes().watch(
+        body=body,
+        pageToken=journal.page_token() or read_start_page_token(drive),
+        **change_scope(),
+    ))
+    info = {
+        "id": resp["id"],
+        "resourceId": resp["resourceId"],
+        "expiration": resp.get("expiration"),
+        "token": token,
+        "address": address,
+        "createdAt": datetime.now(timezone.utc).isoformat(),
+    }
+    with _lock:
+        save_channels(load_channels() + [info])
+        WATCH_STATS["registered"] += 1
+    log.info("Watch channel registered", channel_id=info["id"], expiration=info["expiration"])
+    return info
+
+def stop_channel(drive, channel: dict):
+    try:
+        quota.execute(drive.channels().stop(body={"id": channel["id"], "resourceId": channel["resourceId"]}))
+    except Exception as e:
+        if quota.is_throttle(e):
+            raise
+        # already expired or unknown to Drive: nothing left to stop
+        log.info("Channel stop failed", channel_id=channel["id"], error=str(e))
+    with _lock:
+        save_channels([ch for ch in load_channels() if ch["id"] != channel["id"]])
+        WATCH_STATS["stopped"] += 1
+
+def stop_all(drive) -> int:
+    channels = load_channels()
+    for ch in channels:
+        stop_channel(drive, ch)
+    return len(channels)
+
+def maintain(drive) -> str:
+    """One scheduler tick: re-register after a lapse, renew ahead of expiry, retire replaced channels."""
+    channels = load_channels()
+    if not channels:
+        return "idle"   # never started, or stopped on purpose
+    now = time.time()
+    live = [ch for ch in channels if _expires_at(ch) > now]
+    if not live:
+        log.warning("All watch channels lapsed; re-registering and catching up", channels=len(channels))
+        _bump("lapsed")
+        newest = register_channel(drive)
+        request_catch_up()
+        action = "recovered"
+    else:
+        newest = max(live, key=_expires_at)
+        action = "ok"
+        if _expires_at(newest) - now <= WATCH_RENEW_BEFORE_SECONDS:
+            newest = register_channel(drive)
+            _bump("renewed")
+            action = "renewed"
+
+    # drop expired channels; stop the rest once the replacement has been live for the overlap window
+    created = datetime.fromisoformat(newest["createdAt"]).timestamp() if newest.get("createdAt") else 0.0
+    for ch in channels:
+        if ch["id"] == newest["id"]:
+            continue
+        if _expires_at(ch) <= now:
+            with _lock:
+                save_channels([c for c in load_channels() if c["id"] != ch["id"]])
+        elif now - created >= WATCH_OVERLAP_SECONDS:
+            stop_channel(drive, ch)
+    return action
+
+def _scheduler_loop():
+    while True:
+        try:
+            if journal.acquire_lease("watch", ttl=WATCH_CHECK_SECONDS * 3):
+                maintain(get_drive())
+        except Exception as e:
+            _bump("renew_errors")
+            log.error("Watch maintenance failed", error=str(e))
+        time.sleep(WATCH_CHECK_SECONDS)
+
+def start_scheduler():
+    global _scheduler
+    with _lock:
+        if _scheduler is None:
+            _scheduler = threading.Thread(target=_scheduler_loop, name="watch-scheduler", daemon=True)
+            _scheduler.start()
+
+def watch_stats() -> dict:
+    with _lock:
+        stats = dict(WATCH_STATS)
+    channels = load_channels()
+    now = time.time()
+    live = [_expires_at(ch) for ch in channels if _expires_at(ch) > now]
+    stats["channels"] = len(channels)
+    stats["live"] = len(live)
+    stats["expires_in_s"] = round(max(live) - now) if live and max(live) != float("inf") else None
+    return stats
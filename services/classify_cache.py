@@ -0,0 +1,109 @@
+import sqlite3
+import threading
+import time
+from config import CLASSIFY_CACHE_DB, CLASSIFY_CACHE_TTL_DAYS, CLASSIFY_CACHE_MAX_ENTRIES
+
+# Persistent content-hash -> routing decision cache.
+# Key = "<algo>:<checksum>|<catalog version>", so a catalog change invalidates everything.
+# Each row keeps the tier that made the decision, so only hits on Gemini answers
+# count as saved Gemini calls. Eviction runs every EVICT_EVERY stores, not on each.
+
+EVICT_EVERY = 256
+
+_lock = threading.Lock()
+_conn = None
+_puts_since_evict = 0
+_stats = {"hits": 0, "gemini_hits": 0, "misses": 0, "stores": 0, "evicted": 0, "miss_seconds": 0.0}
+
+def _db():
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(CLASSIFY_CACHE_DB, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS routes ("
+            " key TEXT PRIMARY KEY, label TEXT NOT NULL, confidence REAL NOT NULL,"
+            " rationale TEXT, created_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        _conn.execute("CREATE INDEX IF NOT EXISTS routes_last_used ON routes(last_used)")
+        if "source" not in {row[1] for row in _conn.execute("PRAGMA table_info(routes)")}:
+            _conn.execute("ALTER TABLE routes ADD COLUMN source TEXT")
+        _conn.commit()
+    return _conn
+
+def content_key(file_meta: dict, catalog_version: str) -> str | None:
+    """Drive only reports checksums for blob files; Docs/Sheets are never cached."""
+    if file_meta.get("sha256Checksum"):
+        digest = "sha256:" + file_meta["sha256Checksum"]
+    elif file_meta.get("md5Checksum"):
+        digest = "md5:" + file_meta["md5Checksum"]
+    else:
+        return None
+    return f"{digest}|{catalog_version or ''}"
+
+def get(key: str) -> dict | None:
+    now = time.time()
+    min_created = now - CLASSIFY_CACHE_TTL_DAYS * 86400
+    with _lock:
+        db = _db()
+        row = db.execute(
+            "SELECT label, confidence, rationale, source FROM routes WHERE key = ? AND created_at >= ?",
+            (key, min_created),
+        ).fetchone()
+        if row is None:
+            _stats["misses"] += 1
+            return None
+        db.execute("UPDATE routes SET last_used = ? WHERE key = ?", (now, key))
+        db.commit()
+        _stats["hits"] += 1
+        if row[3] == "gemini":
+            _stats["gemini_hits"] += 1
+    return {"label": row[0], "confidence": row[1], "rationale": row[2] or "", "source": row[3] or ""}
+
+def put(key: str, label: str, confidence: float, rationale: str = "", miss_seconds: float = 0.0,
+        source: str = ""):
+    """Store a decision; `source` is the router tier that made it (keywords, local, gemini)."""
+    global _puts_since_evict
+    now = time.time()
+    with _lock:
+        db = _db()
+        db.execute(
+            "INSERT OR REPLACE INTO routes (key, label, confidence, rationale, created_at, last_used, source)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, label, confidence, rationale, now, now, source),
+        )
+        _stats["stores"] += 1
+        _stats["miss_seconds"] += miss_seconds
+        _puts_since_evict += 1
+        if _puts_since_evict >= EVICT_EVERY:
+            _puts_since_evict = 0
+            _evict(db, now)
+        db.commit()
+
+def _evict(db, now: float):
+    cur = db.execute("DELETE FROM routes WHERE created_at < ?", (now - CLASSIFY_CACHE_TTL_DAYS * 86400,))
+    evicted = cur.rowcount
+    (count,) = db.execute("SELECT COUNT(*) FROM routes").fetchone()
+    overflow = count - CLASSIFY_CACHE_MAX_ENTRIES
+    if overflow > 0:
+        cur = db.execute(
+            "DELETE FROM routes WHERE key IN (SELECT key FROM routes ORDER BY last_used LIMIT ?)",
+            (overflow,),
+        )
+        evicted += cur.rowcount
+    _stats["evicted"] += max(evicted, 0)
+
+def cache_stats() -> dict:
+    with _lock:
+        stats = dict(_stats)
+        (entries,) = _db().execute("SELECT COUNT(*) FROM routes").fetchone()
+    lookups = stats["hits"] + stats["misses"]
+    avg_miss = stats["miss_seconds"] / stats["stores"] if stats["stores"] else 0.0
+    stats["entries"] = entries
+    stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+    stats["avg_miss_seconds"] = round(avg_miss, 3)
+    # Every hit skips a download + extraction; only hits on Gemini's answers skip a Gemini call
+    stats["gemini_calls_saved"] = stats["gemini_hits"]
+    stats["est_seconds_saved"] = round(stats["hits"] * avg_miss, 1)
+    stats["miss_seconds"] = round(stats["miss_seconds"], 1)
+    return stats
@@ -0,0 +1,74 @@
+import tempfile
+from googleapiclient.http import MediaIoBaseDownload
+from config import EXTRACT_MAX_CHARS, DOWNLOAD_CHUNK_SIZE, SPOOL_MAX_MEMORY, PDF_MAX_BYTES
+from .pdf_text import extract_pdf_text
+from .logs import get_logger
+from . import metrics, quota
+
+log = get_logger("content")
+
+# Streaming content reads: decide from metadata whether to download at all, pull
+# bytes in ranged chunks, stop once enough text is available, and spill large
+# bodies to disk so memory per worker stays bounded.
+
+GOOGLE_EXPORTS = {
+    "application/vnd.google-apps.document": "text/plain",
+    "application/vnd.google-apps.spreadsheet": "text/csv",
+}
+
+# UTF-8 worst case is 4 bytes/char; no point fetching more than this for plain text
+TEXT_MAX_BYTES = EXTRACT_MAX_CHARS * 4
+
+def stream_download(request, out, max_bytes: int | None = None) -> int:
+    """Download `request` into `out` in DOWNLOAD_CHUNK_SIZE ranges, stopping after max_bytes."""
+    chunksize = DOWNLOAD_CHUNK_SIZE
+    if max_bytes is not None:
+        chunksize = max(min(chunksize, max_bytes), 256 * 1024)  # Drive wants >= 256KB ranges
+    downloader = MediaIoBaseDownload(out, request, chunksize=chunksize)
+    done = False
+    while not done:
+        status, done = quota.call("drive_read", downloader.next_chunk)   # a retried chunk resumes at the same offset
+        if max_bytes is not None and status.resumable_progress >= max_bytes:
+            break
+    out.seek(0)
+    return status.resumable_progress
+
+def _decode(raw: bytes) -> str:
+    return raw.decode("utf-8", errors="ignore")[:EXTRACT_MAX_CHARS]
+
+def read_text(drive, file_meta: dict) -> tuple[str, bool]:
+    """Return (text, is_binary) for a file, downloading only what routing needs."""
+    file_id = file_meta["id"]
+    mime = file_meta.get("mimeType", "")
+    size = int(file_meta.get("size") or 0)
+
+    if mime in GOOGLE_EXPORTS:
+        req = drive.files().export_media(fileId=file_id, mimeType=GOOGLE_EXPORTS[mime])
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY) as buf:
+            with metrics.span("download", kind="export"):
+                stream_download(req, buf, max_bytes=TEXT_MAX_BYTES)
+            return _decode(buf.read(TEXT_MAX_BYTES)), False
+
+    if mime.startswith("text/"):
+        req = drive.files().get_media(fileId=file_id)
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY) as buf:
+            with metrics.span("download", kind="text"):
+                stream_download(req, buf, max_bytes=TEXT_MAX_BYTES)
+            return _decode(buf.read(TEXT_MAX_BYTES)), False
+
+    if mime == "application/pdf":
+        if size > PDF_MAX_BYTES:
+            log.info("PDF over size cap, routing by name", file=file_meta.get("name", ""), bytes=size)
+            return "", True
+        # PDFs keep their xref table at the end, so the whole file is needed.
+        # It goes to a named temp file so the extraction pool can open it by path.
+        req = drive.files().get_media(fileId=file_id)
+        with tempfile.NamedTemporaryFile(suffix=".pdf") as buf:
+            with metrics.span("download", kind="pdf"):
+                stream_download(req, buf)
+            buf.flush()
+            with metrics.span("pdf_extract"):
+                return extract_pdf_text(buf.name, EXTRACT_MAX_CHARS, file_meta.get("name", "")), False
+
+    # Images, video, archives, ...: content is never used for routing, skip the download
+    return "", True
@@ -1,37 +1,142 @@
-import os, json
-from datetime import datetime, timezone
+import os, json, threading
+from datetime import datetime, timezone, timedelta
+import httplib2
+import google_auth_httplib2
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
-from config import SCOPES, TOKEN_FILE, CLIENT_SECRET_FILE, WATCH_ID_FILE, START_TOKEN_FILE
+from config import (
+    SCOPES, TOKEN_FILE, CLIENT_SECRET_FILE, WATCH_ID_FILE, START_TOKEN_FILE,
+    TOKEN_REFRESH_MARGIN_SECONDS, DRIVE_HTTP_TIMEOUT, DRIVE_ID, RESTRICT_TO_MY_DRIVE,
+)
+from . import quota
 
-def get_drive():
-    creds = None
-    if os.path.exists(TOKEN_FILE):
-        try:
-            creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
-        except Exception:
-            creds = None
+# Process-wide client manager: one credentials object and one parsed discovery
+# document shared by everyone, plus one authorized transport/service per thread
+# (httplib2 connections are not threadsafe, but are pooled per Http instance).
+_creds = None
+_creds_lock = threading.Lock()
+_discovery_doc = None
+_local = threading.local()
+CLIENT_STATS = {"token_loads": 0, "token_refreshes": 0, "discovery_loads": 0, "drive_builds": 0}
+DRIVE_BATCH_LIMIT = 100   # calls Drive accepts in one batch request
 
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
+def _save_token(creds):
+    with open(TOKEN_FILE, "w") as f:
+        f.write(creds.to_json())
+
+def _needs_refresh(creds) -> bool:
+    if not creds.valid:
+        return True
+    if creds.expiry is None:
+        return False
+    now = datetime.now(timezone.utc).replace(tzinfo=None)  # google-auth uses naive UTC
+    return creds.expiry - now < timedelta(seconds=TOKEN_REFRESH_MARGIN_SECONDS)
+
+def get_credentials():
+    """Load token.json once; refresh ahead of expiry instead of on first 401."""
+    global _creds
+    with _creds_lock:
+        creds = _creds
+        if creds is None and os.path.exists(TOKEN_FILE):
+            try:
+                creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
+                CLIENT_STATS["token_loads"] += 1
+            except Exception:
+                creds = None
+
+        if creds is None or (_needs_refresh(creds) and not creds.refresh_token):
             flow = InstalledAppFlow.from_client_secrets_file(CLIENT_SECRET_FILE, SCOPES)
             creds = flow.run_local_server(
                 port=8081, access_type="offline", prompt="consent"
             )
-        with open(TOKEN_FILE, "w") as f:
-            f.write(creds.to_json())
-    return build("drive", "v3", credentials=creds)
+            _save_token(creds)
+        elif _needs_refresh(creds):
+            creds.refresh(Request())
+            CLIENT_STATS["token_refreshes"] += 1
+            _save_token(creds)
+        _creds = creds
+        return creds
+
+def _drive_discovery_doc():
+    global _discovery_doc
+    with _creds_lock:
+        if _discovery_doc is None:
+            _discovery_doc = json.loads(get_static_doc("drive", "v3"))
+            CLIENT_STATS["discovery_loads"] += 1
+        return _discovery_doc
+
+def get_drive():
+    creds = get_credentials()
+    drive = getattr(_local, "drive", None)
+    if drive is None:
+        http = google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http(timeout=DRIVE_HTTP_TIMEOUT))
+        drive = build_from_document(_drive_discovery_doc(), http=http)
+        _local.drive, _local.http = drive, http
+        with _creds_lock:
+            CLIENT_STATS["drive_builds"] += 1
+    return drive
+
+def get_http():
+    """The calling thread's authorized transport (the one behind its get_drive()),
+    for plain requests the discovery service has no method for, e.g. thumbnailLink."""
+    get_drive()
+    return _local.http
+
+def client_stats() -> dict:
+    with _creds_lock:
+        return dict(CLIENT_STATS)
+
+def change_scope() -> dict:
+    """kwargs shared by changes().list/watch: narrow the feed server-side where possible."""
+    if DRIVE_ID:
+        return {"driveId": DRIVE_ID, "includeItemsFromAllDrives": True, "supportsAllDrives": True}
+    if RESTRICT_TO_MY_DRIVE:
+        return {"restrictToMyDrive": True, "supportsAllDrives": True}
+    return {"includeItemsFromAllDrives": True, "supportsAllDrives": True}
+
+def batch_execute(drive, requests: dict, api: str = "drive_read") -> tuple[dict, dict]:
+    """Run {key: request} through Drive batch calls of up to DRIVE_BATCH_LIMIT.
+
+    Returns (responses, errors) by key. A batch that fails as a whole (network,
+    auth) reports its error for every key it carried that has no answer yet.
+    """
+    responses, errors = {}, {}
+    keys = list(requests)
+
+    def _callback(request_id, response, exception):
+        if exception is not None:
+            quota.observe(api, exception)
+            errors[request_id] = exception
+        else:
+            responses[request_id] = response
+
+    for start in range(0, len(keys), DRIVE_BATCH_LIMIT):
+        chunk = keys[start:start + DRIVE_BATCH_LIMIT]
+        batch = drive.new_batch_http_request(callback=_callback)
+        for key in chunk:
+            batch.add(requests[key], request_id=key)
+        try:
+            quota.execute_batch(batch, api, len(chunk))
+        except Exception as e:
+            for key in chunk:
+                if key not in responses:
+                    errors.setdefault(key, e)
+    return responses, errors
+
+def q_escape(value: str) -> str:
+    """Quote a value for a files().list `q` string literal."""
+    return value.replace("\\", "\\\\").replace("'", "\\'")
 
 def read_start_page_token(drive):
     if os.path.exists(START_TOKEN_FILE):
         with open(START_TOKEN_FILE, "r") as f:
             tok = f.read().strip()
             if tok: return tok
-    tok = drive.changes().getStartPageToken().execute()["startPageToken"]
+    scope = {k: v for k, v in change_scope().items() if k in ("driveId", "supportsAllDrives")}
+    tok = quota.execute(drive.changes().getStartPageToken(**scope))["startPageToken"]
     with open(START_TOKEN_FILE, "w") as f:
         f.write(tok)
     return tok
@@ -41,8 +146,11 @@ def write_start_page_token(tok: str):
         f.write(tok)
 
 def save_watch_info(data: dict):
-    with open(WATCH_ID_FILE, "w") as f:
+    # atomic replace: webhook handlers in other processes read this file per request
+    tmp = f"{WATCH_ID_FILE}.tmp"
+    with open(tmp, "w") as f:
         json.dump(data, f, indent=2)
+    os.replace(tmp, WATCH_ID_FILE)
 
 def load_watch_info():
     if not os.path.exists(WATCH_ID_FILE):
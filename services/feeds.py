@@ -0,0 +1,92 @@
+import json
+from config import FEED_PAGE_SIZE, FOLDER_MIME
+from .drive_client import change_scope, q_escape
+from .processing import FILE_FIELDS
+from . import quota
+
+# Ingestion feeds. Both are generators of (items, checkpoint) per page, where
+# items is a list of (file resource, change time); nothing beyond one page is
+# ever held in memory, and the checkpoint is what to resume from after it.
+#
+#   changes - changes().list with a tight field mask, removals dropped server
+#             side and, where configured, scoped to one shared drive / My Drive
+#   folder  - files().list of DRIVE_FOLDER_ID children modified since the last
+#             checkpoint; cheaper on busy accounts where most changes are noise.
+#             That filter cannot see files moved into the folder (or uploaded
+#             with a preserved, older modifiedTime) after the checkpoint, so the
+#             drainer also runs iter_folder_sweep every FOLDER_SWEEP_SECONDS
+# iter_children_pages is the plain listing behind backfills: every child, with
+# the next page token as the checkpoint.
+
+FOLDER_FILE_FIELDS = FILE_FIELDS + ",modifiedTime"
+
+def iter_change_pages(drive, page_token: str):
+    while page_token:
+        resp = quota.execute(drive.changes().list(
+            pageToken=page_token,
+            pageSize=FEED_PAGE_SIZE,
+            includeRemoved=False,
+            fields=f"nextPageToken,newStartPageToken,changes(time,file({FILE_FIELDS}))",
+            **change_scope(),
+        ))
+        items = [(ch["file"], ch.get("time")) for ch in resp.get("changes", []) if ch.get("file")]
+        next_token = resp.get("nextPageToken")
+        checkpoint = next_token or resp.get("newStartPageToken")
+        if not checkpoint:
+            return
+        yield items, checkpoint
+        page_token = next_token
+
+def iter_folder_pages(drive, folder_id: str, since: str):
+    """Children of folder_id with modifiedTime >= since, oldest first.
+
+    `>=` plus the journal's (fileId, time) dedupe means files sharing the
+    checkpoint timestamp across a page boundary are neither lost nor redone.
+    """
+    q = (
+        f"'{q_escape(folder_id)}' in parents and trashed = false "
+        f"and modifiedTime >= '{since}'"
+    )
+    page_token = None
+    checkpoint = since
+    while True:
+        resp = quota.execute(drive.files().list(
+            q=q,
+            orderBy="modifiedTime",
+            pageSize=FEED_PAGE_SIZE,
+            pageToken=page_token,
+            fields=f"nextPageToken,files({FOLDER_FILE_FIELDS})",
+            includeItemsFromAllDrives=True, supportsAllDrives=True,
+        ))
+        items = [(f, f.get("modifiedTime")) for f in resp.get("files", [])]
+        if items:
+            checkpoint = max(checkpoint, max(t or "" for _, t in items))
+        yield items, checkpoint
+        page_token = resp.get("nextPageToken")
+        if not page_token:
+            return
+
+def iter_folder_sweep(drive, folder_id: str, state: dict):
+    """Every child of folder_id, keyed by modifiedTime like iter_folder_pages.
+
+    The journal's (fileId, time) dedupe drops what the poll already recorded;
+    the checkpoint is the sweep state as JSON, page_token None once it is done.
+    """
+    for items, token in iter_children_pages(drive, folder_id, state.get("page_token"), FOLDER_FILE_FIELDS):
+        yield [(f, f.get("modifiedTime")) for f, _ in items], json.dumps({**state, "page_token": token})
+
+def iter_children_pages(drive, folder_id: str, page_token: str | None = None, fields: str = FILE_FIELDS):
+    """All non-folder children of folder_id; the checkpoint is the next page token (None at the end)."""
+    q = f"'{q_escape(folder_id)}' in parents and trashed = false and mimeType != '{FOLDER_MIME}'"
+    while True:
+        resp = quota.execute(drive.files().list(
+            q=q,
+            pageSize=FEED_PAGE_SIZE,
+            pageToken=page_token,
+            fields=f"nextPageToken,files({fields})",
+            includeItemsFromAllDrives=True, supportsAllDrives=True,
+        ))
+        page_token = resp.get("nextPageToken")
+        yield [(f, None) for f in resp.get("files", [])], page_token
+        if not page_token:
+            return
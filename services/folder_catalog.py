@@ -1,52 +1,100 @@
 import csv
 from config import FOLDER_MIME
 from googleapiclient.errors import HttpError
+from .drive_client import q_escape, batch_execute
+from . import metrics, quota
+from .logs import get_logger
 
-def _q_escape(value: str) -> str:
-    return value.replace("\\", "\\\\").replace("'", "\\'")
-
-def _search_folder_by_name(drive, name: str, parent_id: str):
-    safe = _q_escape(name)
-    q = (
-        f"name = '{safe}' and "
-        f"'{parent_id}' in parents and "
-        f"mimeType = '{FOLDER_MIME}' and trashed = false"
-    )
-    resp = drive.files().list(
-        q=q, fields="files(id,name)",
-        includeItemsFromAllDrives=True, supportsAllDrives=True
-    ).execute()
-    files = resp.get("files", [])
-    return files[0] if files else None
+CATALOG_FIELDS = ["label", "folder_id", "description", "keywords"]
+log = get_logger("folder")
 
 def _create_folder(drive, name: str, parent_id: str) -> str:
     meta = {"name": name, "mimeType": FOLDER_MIME, "parents": [parent_id]}
-    created = drive.files().create(
+    created = quota.execute(drive.files().create(
         body=meta, fields="id", supportsAllDrives=True
-    ).execute()
+    ), "drive_write")
     return created["id"]
 
-def ensure_folder(drive, label: str, existing_id: str | None, parent_id: str) -> str:
-    if existing_id:
-        try:
-            meta = drive.files().get(
-                fileId=existing_id, fields="id,name,mimeType,trashed,parents",
-                supportsAllDrives=True
-            ).execute()
-            if meta.get("trashed") or meta.get("mimeType") != FOLDER_MIME:
-                existing_id = None
-        except HttpError:
-            existing_id = None
+def list_child_folders(drive, parent_id: str) -> list:
+    """Every live folder directly under parent_id, one paginated listing."""
+    folders, page_token = [], None
+    while True:
+        resp = quota.execute(drive.files().list(
+            q=f"'{q_escape(parent_id)}' in parents and mimeType = '{FOLDER_MIME}' and trashed = false",
+            fields="nextPageToken,files(id,name)",
+            pageSize=1000, pageToken=page_token,
+            includeItemsFromAllDrives=True, supportsAllDrives=True,
+        ))
+        folders.extend(resp.get("files", []))
+        page_token = resp.get("nextPageToken")
+        if not page_token:
+            return folders
+
+def reconcile_folders(drive, rows: list, parent_id: str) -> list:
+    """Resolve a folder id for every row against a single listing of parent_id.
+
+    Ids outside the parent are verified with one batched get; missing labels are
+    created with one batched create. Returns the labels whose id changed.
+    """
+    children = list_child_folders(drive, parent_id)
+    live_ids = {f["id"] for f in children}
+    by_name = {}
+    for f in children:
+        by_name.setdefault(f["name"], f["id"])
 
-    if not existing_id:
-        found = _search_folder_by_name(drive, label, parent_id)
-        if found:
-            return found["id"]
-        new_id = _create_folder(drive, label, parent_id)
-        print(f"[FOLDER] Created '{label}' -> {new_id}")
-        return new_id
+    # Configured ids that live elsewhere (moved by hand, other parent): verify in bulk
+    foreign = {str(i): row["folder_id"] for i, row in enumerate(rows)
+               if row["folder_id"] and row["folder_id"] not in live_ids}
+    if foreign:
+        gets = {key: drive.files().get(fileId=fid, fields="id,mimeType,trashed", supportsAllDrives=True)
+                for key, fid in foreign.items()}
+        found, errors = batch_execute(drive, gets)
+        for key, err in errors.items():
+            # a throttled or failed lookup is not a missing folder: ask again rather than create a duplicate
+            if not isinstance(err, HttpError) or quota.is_throttle(err) or quota.is_transient(err):
+                try:
+                    found[key] = quota.execute(gets[key])
+                except HttpError:
+                    pass
+        live_ids.update(
+            meta["id"] for meta in found.values()
+            if not meta.get("trashed") and meta.get("mimeType") == FOLDER_MIME
+        )
 
-    return existing_id
+    changed, missing = [], {}
+    for i, row in enumerate(rows):
+        if row["folder_id"] in live_ids:
+            continue
+        if row["label"] in by_name:
+            row["folder_id"] = by_name[row["label"]]
+            changed.append(row["label"])
+        else:
+            # a label listed twice gets one folder
+            missing.setdefault(row["label"], []).append(row)
+
+    if missing:
+        keys = {str(i): label for i, label in enumerate(missing)}
+        creates = {
+            key: drive.files().create(
+                body={"name": label, "mimeType": FOLDER_MIME, "parents": [parent_id]},
+                fields="id", supportsAllDrives=True,
+            )
+            for key, label in keys.items()
+        }
+        created, errors = batch_execute(drive, creates, "drive_write")
+        for key, label in keys.items():
+            if key in created:
+                folder_id = created[key]["id"]
+            else:
+                log.warning("Batched create failed; retrying alone", label=label, error=str(errors.get(key)))
+                folder_id = _create_folder(drive, label, parent_id)
+            for row in missing[label]:
+                row["folder_id"] = folder_id
+            by_name[label] = folder_id
+            changed.append(label)
+            log.info("Created label folder", label=label, folder_id=folder_id)
+            metrics.inc("folderheist_folders_created_total")
+    return changed
 
 def ensure_folders_from_csv(drive, csv_path: str, parent_id: str):
     rows = []
@@ -54,20 +102,28 @@ def ensure_folders_from_csv(drive, csv_path: str, parent_id: str):
         r = csv.DictReader(f)
         assert "label" in r.fieldnames and "folder_id" in r.fieldnames, \
             "CSV must have 'label' and 'folder_id' headers."
+        same_header = r.fieldnames == CATALOG_FIELDS
         for row in r:
             label = (row.get("label") or "").strip()
             if not label: continue
-            current_id = (row.get("folder_id") or "").strip() or None
-            folder_id = ensure_folder(drive, label, current_id, parent_id)
-            row["folder_id"] = folder_id
-            row["description"] = (row.get("description") or "").strip()
-            rows.append(row)
+            rows.append({
+                "label": label,
+                "folder_id": (row.get("folder_id") or "").strip(),
+                "description": (row.get("description") or "").strip(),
+                "keywords": (row.get("keywords") or "").strip(),
+            })
+
+    with metrics.span("catalog_reconcile"):
+        changed = reconcile_folders(drive, rows, parent_id)
 
-    with open(csv_path, "w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=["label", "folder_id", "description"])
-        w.writeheader(); w.writerows(rows)
+    # Steady state (nothing created or re-pointed) leaves the file untouched
+    if changed or not same_header:
+        with open(csv_path, "w", newline="", encoding="utf-8") as f:
+            w = csv.DictWriter(f, fieldnames=CATALOG_FIELDS)
+            w.writeheader(); w.writerows(rows)
 
-    label_to_id = {r["label"].strip(): r["folder_id"].strip() for r in rows}
-    label_desc = {r["label"].strip(): r["description"] for r in rows if r.get("description")}
-    allowed = [r["label"].strip() for r in rows]
-    return label_to_id, label_desc, allowed
+    label_to_id = {r["label"]: r["folder_id"] for r in rows}
+    label_desc = {r["label"]: r["description"] for r in rows if r.get("description")}
+    allowed = [r["label"] for r in rows]
+    label_keywords = {r["label"]: r["keywords"] for r in rows if r.get("keywords")}
+    return label_to_id, label_desc, allowed, label_keywords
@@ -0,0 +1,195 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from config import JOURNAL_DB, JOURNAL_LEASE_SECONDS, JOURNAL_RETENTION_DAYS, JOURNAL_CLAIM_SECONDS
+
+# Durable change-feed journal (SQLite, WAL mode), shared by every thread and
+# worker process:
+#   checkpoint - where each feed resumes (changes page token, folder-poll
+#                modifiedTime), advanced page by page
+#   items      - one row per (fileId, change time) with the file resource, its
+#                status and the process that claimed it, so duplicate
+#                notifications are no-ops and pending work survives a restart
+#   lease      - only the holder may drain the changes feed
+# Backfill runs reuse all three: checkpoint "backfill:<run>", items keyed
+# (fileId, "backfill:<run>") and a "backfill" lease.
+# A page's new items and the token that follows it commit in one transaction,
+# claimed by the recording process. A heartbeat thread extends every claim the
+# process holds; only pending items whose claim has lapsed (their process died)
+# are replayed, so items still queued or in flight elsewhere are never redone.
+
+OWNER = f"{socket.gethostname()}:{os.getpid()}"
+_local = threading.local()
+_heartbeat = None
+_heartbeat_lock = threading.Lock()
+
+def _db():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(JOURNAL_DB, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(
+            "CREATE TABLE IF NOT EXISTS checkpoint (key TEXT PRIMARY KEY, value TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS items ("
+            " file_id TEXT NOT NULL, change_time TEXT NOT NULL, status TEXT NOT NULL,"
+            " file_json TEXT NOT NULL, updated_at REAL NOT NULL,"
+            " PRIMARY KEY (file_id, change_time));"
+            "CREATE INDEX IF NOT EXISTS items_status ON items(status, updated_at);"
+            "CREATE TABLE IF NOT EXISTS lease (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL);"
+        )
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(items)")}
+        if "owner" not in columns:
+            # journals from before claims: their pending items count as lapsed
+            conn.execute("ALTER TABLE items ADD COLUMN owner TEXT")
+            conn.execute("ALTER TABLE items ADD COLUMN claimed_until REAL NOT NULL DEFAULT 0")
+        _local.conn = conn
+    return conn
+
+@contextmanager
+def _tx():
+    db = _db()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        yield db
+        db.execute("COMMIT")
+    except BaseException:
+        db.execute("ROLLBACK")
+        raise
+
+# -- lease --------------------------------------------------------------------
+
+def acquire_lease(name: str = "changes", ttl: float = JOURNAL_LEASE_SECONDS) -> bool:
+    """Take or renew the lease; False while another live consumer holds it."""
+    owner = f"{OWNER}:{threading.get_ident()}"
+    now = time.time()
+    with _tx() as db:
+        row = db.execute("SELECT owner, expires_at FROM lease WHERE name = ?", (name,)).fetchone()
+        if row and row[0] != owner and row[1] > now:
+            return False
+        db.execute(
+            "INSERT OR REPLACE INTO lease (name, owner, expires_at) VALUES (?, ?, ?)",
+            (name, owner, now + ttl),
+        )
+    return True
+
+def release_lease(name: str = "changes"):
+    owner = f"{OWNER}:{threading.get_ident()}"
+    with _tx() as db:
+        db.execute("DELETE FROM lease WHERE name = ? AND owner = ?", (name, owner))
+
+# -- checkpoint ---------------------------------------------------------------
+
+def checkpoint(key: str = "page_token") -> str | None:
+    row = _db().execute("SELECT value FROM checkpoint WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+def set_checkpoint(value: str, key: str = "page_token"):
+    with _tx() as db:
+        db.execute("INSERT OR REPLACE INTO checkpoint (key, value) VALUES (?, ?)", (key, value))
+
+def page_token() -> str | None:
+    return checkpoint("page_token")
+
+def commit_page(files: list, next_token: str, key: str = "page_token") -> list:
+    """Record a page's (file, change_time) pairs and advance the checkpoint atomically.
+
+    Returns only the items not seen before, as (file, key) ready to enqueue.
+    """
+    _start_heartbeat()
+    fresh = []
+    now = time.time()
+    with _tx() as db:
+        for file, change_time in files:
+            item_key = (file["id"], change_time or "")
+            cur = db.execute(
+                "INSERT OR IGNORE INTO items (file_id, change_time, status, file_json, updated_at, owner, claimed_until)"
+                " VALUES (?, ?, 'pending', ?, ?, ?, ?)",
+                (item_key[0], item_key[1], json.dumps(file), now, OWNER, now + JOURNAL_CLAIM_SECONDS),
+            )
+            if cur.rowcount:
+                fresh.append((file, item_key))
+        db.execute("INSERT OR REPLACE INTO checkpoint (key, value) VALUES (?, ?)", (key, next_token))
+    return fresh
+
+# -- items --------------------------------------------------------------------
+
+def mark(key, status: str):
+    with _tx() as db:
+        db.execute(
+            "UPDATE items SET status = ?, updated_at = ? WHERE file_id = ? AND change_time = ?",
+            (status, time.time(), key[0], key[1]),
+        )
+
+def claim_lapsed(run: str | None = None) -> list:
+    """Take over pending items whose claim has lapsed (their process died mid-backlog).
+
+    Change-feed items by default; `run` selects one backfill run's instead.
+    Items another live process holds are left alone.
+    """
+    _start_heartbeat()
+    if run is None:
+        where, args = "change_time NOT LIKE 'backfill:%'", ()
+    else:
+        where, args = "change_time = ?", (f"backfill:{run}",)
+    now = time.time()
+    with _tx() as db:
+        rows = db.execute(
+            f"SELECT file_id, change_time, file_json FROM items"
+            f" WHERE status = 'pending' AND claimed_until < ? AND {where} ORDER BY updated_at",
+            (now, *args),
+        ).fetchall()
+        db.executemany(
+            "UPDATE items SET owner = ?, claimed_until = ? WHERE file_id = ? AND change_time = ?",
+            [(OWNER, now + JOURNAL_CLAIM_SECONDS, fid, ctime) for fid, ctime, _ in rows],
+        )
+    return [(json.loads(file_json), (fid, ctime)) for fid, ctime, file_json in rows]
+
+def renew_claims() -> int:
+    """Extend every pending claim this process holds."""
+    with _tx() as db:
+        return db.execute(
+            "UPDATE items SET claimed_until = ? WHERE owner = ? AND status = 'pending'",
+            (time.time() + JOURNAL_CLAIM_SECONDS, OWNER),
+        ).rowcount
+
+def _heartbeat_loop():
+    while True:
+        time.sleep(JOURNAL_CLAIM_SECONDS / 3)
+        try:
+            renew_claims()
+        except sqlite3.Error:
+            pass   # the next beat retries well within the claim
+
+def _start_heartbeat():
+    global _heartbeat
+    with _heartbeat_lock:
+        if _heartbeat is None:
+            _heartbeat = threading.Thread(target=_heartbeat_loop, name="journal-heartbeat", daemon=True)
+            _heartbeat.start()
+
+def prune():
+    cutoff = time.time() - JOURNAL_RETENTION_DAYS * 86400
+    with _tx() as db:
+        db.execute("DELETE FROM items WHERE status != 'pending' AND updated_at < ?", (cutoff,))
+
+def run_stats(run: str) -> dict:
+    rows = _db().execute(
+        "SELECT status, COUNT(*) FROM items WHERE change_time = ? GROUP BY status", (f"backfill:{run}",)
+    ).fetchall()
+    return dict(rows)
+
+def journal_stats() -> dict:
+    db = _db()
+    counts = dict(db.execute("SELECT status, COUNT(*) FROM items GROUP BY status").fetchall())
+    lease = db.execute("SELECT owner, expires_at FROM lease WHERE name = 'changes'").fetchone()
+    return {
+        "items": counts,
+        "page_token": page_token(),
+        "folder_since": checkpoint("folder_since"),
+        "lease_owner": lease[0] if lease and lease[1] > time.time() else None,
+    }
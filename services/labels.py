@@ -1,12 +1,71 @@
+import os
+import threading
+import time
 from .folder_catalog import ensure_folders_from_csv
-from config import FOLDER_CATALOG_CSV, DRIVE_PARENT_ID
-from state import LABEL_TO_ID, LABEL_DESC, ALLOWED, LABEL_FOLDER_IDS
+from config import FOLDER_CATALOG_CSV, DRIVE_PARENT_ID, CATALOG_SNAPSHOT_FILE, CATALOG_RELOAD_INTERVAL
+import state
+from .logs import get_logger
+from . import metrics
+
+log = get_logger("hydrate")
+
+_reload_lock = threading.Lock()
+_last_check = 0.0
+_snapshot_mtime = 0.0
+
+def apply_catalog(label_to_id: dict, label_desc: dict, allowed: list, label_keywords: dict) -> state.CatalogSnapshot:
+    """Build a new immutable snapshot, swap it in and share it with sibling processes."""
+    global _snapshot_mtime
+    snapshot = state.CatalogSnapshot(label_to_id, label_desc, allowed, label_keywords,
+                                     generation=state.current().generation + 1)
+    state.publish(snapshot)
+    if CATALOG_SNAPSHOT_FILE:
+        try:
+            state.save_snapshot(snapshot, CATALOG_SNAPSHOT_FILE)
+            _snapshot_mtime = os.path.getmtime(CATALOG_SNAPSHOT_FILE)
+        except OSError as e:
+            log.warning("Could not write catalog snapshot", error=str(e))
+    return snapshot
+
+def catalog() -> state.CatalogSnapshot:
+    """Current snapshot; picks up a newer one written by another worker process.
+
+    The snapshot file is stat'ed at most every CATALOG_RELOAD_INTERVAL seconds,
+    so the hot path is a module attribute read.
+    """
+    global _last_check, _snapshot_mtime
+    now = time.monotonic()
+    if not CATALOG_SNAPSHOT_FILE or now - _last_check < CATALOG_RELOAD_INTERVAL:
+        return state.current()
+    with _reload_lock:
+        _last_check = now
+        try:
+            mtime = os.path.getmtime(CATALOG_SNAPSHOT_FILE)
+        except OSError:
+            return state.current()
+        if mtime > _snapshot_mtime:
+            loaded = state.load_snapshot(CATALOG_SNAPSHOT_FILE)
+            if loaded is not None:
+                _snapshot_mtime = mtime
+                if loaded.version != state.current().version:
+                    state.publish(loaded)
+                    log.info("Loaded shared catalog", version=loaded.version)
+    return state.current()
 
 def hydrate_labels(drive) -> None:
-    """Load CSV→Drive folder map into in-memory globals (mutates, no rebinding)."""
-    label_to_id, label_desc, allowed = ensure_folders_from_csv(drive, FOLDER_CATALOG_CSV, DRIVE_PARENT_ID)
-    LABEL_TO_ID.clear(); LABEL_TO_ID.update(label_to_id)
-    LABEL_DESC.clear(); LABEL_DESC.update(label_desc)
-    ALLOWED.clear(); ALLOWED.extend(allowed)
-    LABEL_FOLDER_IDS.clear(); LABEL_FOLDER_IDS.update(LABEL_TO_ID.values())
-    print(f"[HYDRATE] labels={len(ALLOWED)} folders={len(LABEL_FOLDER_IDS)}")
+    """Reconcile the CSV with Drive and publish the result as a new catalog snapshot."""
+    with metrics.span("catalog_hydrate"):
+        snapshot = apply_catalog(*ensure_folders_from_csv(drive, FOLDER_CATALOG_CSV, DRIVE_PARENT_ID))
+    log.info("Catalog hydrated", labels=len(snapshot.allowed), folders=len(snapshot.folder_ids), version=snapshot.version)
+
+def ensure_catalog(drive) -> state.CatalogSnapshot:
+    """Catalog for a worker: the shared snapshot if any process already hydrated, else hydrate."""
+    global _last_check
+    cat = catalog()
+    if not cat:
+        _last_check = 0.0   # force a snapshot-file check before paying for a Drive hydration
+        cat = catalog()
+    if not cat:
+        hydrate_labels(drive)
+        cat = state.current()
+    return cat
@@ -0,0 +1,64 @@
+import json
+import logging
+import sys
+import threading
+from config import LOG_LEVEL, LOG_FORMAT
+
+# Structured logging: one JSON object per line (LOG_FORMAT=text keeps the old
+# "[TAG] message" look for local runs). Fields are keyword arguments:
+#
+#   log = get_logger("route")
+#   log.info("Routed", file_id=fid, label=label, confidence=0.91)
+#
+# Level checks happen before any formatting, so debug lines on the hot path
+# cost one comparison when disabled.
+
+_RESERVED = {"exc_info", "stack_info", "stacklevel", "extra"}
+_ROOT = "folderheist"
+_configured = False
+_configure_lock = threading.Lock()
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        out = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name.removeprefix(_ROOT + "."),
+            "msg": record.getMessage(),
+        }
+        out.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out, default=str)
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        tag = record.name.removeprefix(_ROOT + ".").upper()
+        fields = " ".join(f"{k}={v}" for k, v in (getattr(record, "fields", None) or {}).items())
+        line = f"[{tag}] {record.getMessage()}" + (f" {fields}" if fields else "")
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+class _FieldsAdapter(logging.LoggerAdapter):
+    def process(self, msg, kwargs):
+        fields = {k: kwargs.pop(k) for k in list(kwargs) if k not in _RESERVED}
+        kwargs["extra"] = {"fields": fields}
+        return msg, kwargs
+
+def _configure():
+    global _configured
+    with _configure_lock:
+        if _configured:
+            return
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(TextFormatter() if LOG_FORMAT == "text" else JsonFormatter())
+        root = logging.getLogger(_ROOT)
+        root.addHandler(handler)
+        root.setLevel(LOG_LEVEL)
+        root.propagate = False
+        _configured = True
+
+def get_logger(name: str) -> logging.LoggerAdapter:
+    _configure()
+    return _FieldsAdapter(logging.getLogger(f"{_ROOT}.{name}"), {})
@@ -0,0 +1,168 @@
+import io
+import re
+import threading
+from googleapiclient.errors import HttpError
+from config import (
+    EXTRACT_MAX_CHARS, MEDIA_PREVIEW, MEDIA_PREVIEW_PX, MEDIA_PREVIEW_MAX_BYTES,
+    MEDIA_OCR, MEDIA_OCR_PX, MEDIA_SCAN_MIN_CHARS,
+)
+from .drive_client import get_http
+from .logs import get_logger
+from . import metrics, quota
+
+log = get_logger("media")
+
+# Photos and scans: instead of the original (megabytes, useless as text), fetch
+# Drive's own rendition through thumbnailLink at a bounded size. Nothing is
+# fetched until the cheap tiers have failed on the name and imageMediaMetadata;
+# then, with pytesseract + Pillow installed (MEDIA_OCR=auto), a larger
+# rendition is OCR'd and, if it reads as text, routed like any document;
+# otherwise the small preview goes to a multimodal Gemini call.
+
+MEDIA_FIELDS = "thumbnailLink,hasThumbnail,imageMediaMetadata(width,height,time,cameraMake,cameraModel)"
+MIN_PREVIEW_PX = 128
+OCR_MAX_BYTES = 4 * 1024 * 1024
+
+_lock = threading.Lock()
+_ocr_ready = None
+MEDIA_STATS = {"previews": 0, "preview_bytes": 0, "original_bytes": 0, "ocr": 0, "ocr_text": 0, "failed": 0}
+
+def wants_preview(file_meta: dict, text: str) -> bool:
+    """Images always; PDFs whose text layer is (nearly) empty, i.e. scans or over the size cap."""
+    if not MEDIA_PREVIEW:
+        return False
+    mime = file_meta.get("mimeType", "")
+    if mime.startswith("image/"):
+        return True
+    return mime == "application/pdf" and len((text or "").strip()) < MEDIA_SCAN_MIN_CHARS
+
+def media_hint(file_meta: dict) -> str:
+    """imageMediaMetadata as one line of routing context (camera, capture time, pixel size)."""
+    meta = file_meta.get("imageMediaMetadata") or {}
+    parts = []
+    camera = " ".join(filter(None, (meta.get("cameraMake"), meta.get("cameraModel"))))
+    if camera:
+        parts.append(f"Camera: {camera}")
+    if meta.get("time"):
+        parts.append(f"Taken: {meta['time']}")
+    if meta.get("width") and meta.get("height"):
+        parts.append(f"Size: {meta['width']}x{meta['height']} px")
+    return "; ".join(parts)
+
+def _sized(link: str, px: int) -> str:
+    # thumbnail links end in "=s220" (optionally "-c" etc.); the suffix picks the rendition size
+    return re.sub(r"=s\d+(-[\w-]*)?$", f"=s{px}", link)
+
+def _fetch(link: str, px: int) -> tuple[bytes, str]:
+    url = _sized(link, px)
+
+    def _get():
+        resp, body = get_http().request(url, "GET")
+        if resp.status >= 400:
+            raise HttpError(resp, body, uri=url)
+        return body, resp.get("content-type", "image/jpeg").split(";")[0]
+    return quota.call("drive_read", _get)
+
+def _thumbnail_link(drive, file_meta: dict, refresh: bool = False) -> str | None:
+    if not refresh and file_meta.get("thumbnailLink"):
+        return file_meta["thumbnailLink"]
+    # journaled items may carry a link that has since expired, older ones none at all
+    meta = quota.execute(drive.files().get(fileId=file_meta["id"], fields=MEDIA_FIELDS, supportsAllDrives=True))
+    file_meta.update(meta)
+    return meta.get("thumbnailLink")
+
+def _ocr_enabled() -> bool:
+    global _ocr_ready
+    if MEDIA_OCR != "auto":
+        return False
+    if _ocr_ready is None:
+        try:
+            import pytesseract
+            from PIL import Image  # noqa: F401
+            pytesseract.get_tesseract_version()
+            _ocr_ready = True
+        except Exception:
+            _ocr_ready = False
+    return _ocr_ready
+
+def _ocr(data: bytes) -> str:
+    import pytesseract
+    from PIL import Image
+    with Image.open(io.BytesIO(data)) as img:
+        return pytesseract.image_to_string(img)[:EXTRACT_MAX_CHARS]
+
+def _preview(link: str) -> tuple[bytes, str] | None:
+    px = MEDIA_PREVIEW_PX
+    while px >= MIN_PREVIEW_PX:
+        data, mime = _fetch(link, px)
+        if len(data) <= MEDIA_PREVIEW_MAX_BYTES:
+            return data, mime
+        px //= 2
+    return None
+
+def _with_link(drive, file_meta: dict, fn):
+    """fn(link), retried once with a fresh link if the stored one has expired."""
+    link = _thumbnail_link(drive, file_meta)
+    if not link:
+        return None
+    try:
+        return fn(link)
+    except HttpError as e:
+        if quota.is_throttle(e) or getattr(e.resp, "status", 0) not in (403, 404):
+            raise
+        link = _thumbnail_link(drive, file_meta, refresh=True)
+        return fn(link) if link else None
+
+def _failed(file_meta: dict, e: Exception):
+    if quota.is_throttle(e):
+        raise e
+    log.warning("Preview failed, routing without it", file=file_meta.get("name", ""), error=str(e))
+    with _lock:
+        MEDIA_STATS["failed"] += 1
+
+def scan_text(drive, file_meta: dict) -> str:
+    """OCR text of a MEDIA_OCR_PX rendition; "" when OCR is unavailable or the
+    text is too thin to route the file as a document."""
+    if not _ocr_enabled():
+        return ""
+    try:
+        data = _with_link(drive, file_meta, lambda link: _fetch(link, MEDIA_OCR_PX)[0])
+        text = _ocr(data) if data and len(data) <= OCR_MAX_BYTES else ""
+    except Exception as e:
+        _failed(file_meta, e)
+        return ""
+    readable = len(" ".join(text.split())) >= MEDIA_SCAN_MIN_CHARS
+    with _lock:
+        MEDIA_STATS["ocr"] += 1
+        if readable:
+            MEDIA_STATS["ocr_text"] += 1
+            MEDIA_STATS["original_bytes"] += int(file_meta.get("size") or 0)
+    return text if readable else ""
+
+def preview_image(drive, file_meta: dict) -> tuple[bytes, str] | None:
+    """(bytes, mime) of a rendition within MEDIA_PREVIEW_MAX_BYTES, or None."""
+    try:
+        with metrics.span("preview", mime=file_meta.get("mimeType", "")):
+            image = _with_link(drive, file_meta, _preview)
+    except Exception as e:
+        _failed(file_meta, e)
+        return None
+    if image is not None:
+        size = int(file_meta.get("size") or 0)
+        with _lock:
+            MEDIA_STATS["previews"] += 1
+            MEDIA_STATS["preview_bytes"] += len(image[0])
+            MEDIA_STATS["original_bytes"] += size
+        log.debug("Preview", file=file_meta.get("name", ""), bytes=len(image[0]), original_bytes=size)
+    return image
+
+def read_media(drive, file_meta: dict) -> tuple[str, tuple[bytes, str] | None]:
+    """(OCR text, None) when the scan reads as a document, else ("", preview or None)."""
+    text = scan_text(drive, file_meta)
+    return text, (None if text else preview_image(drive, file_meta))
+
+def media_stats() -> dict:
+    with _lock:
+        stats = dict(MEDIA_STATS)
+    stats["ocr_available"] = bool(_ocr_ready)
+    return stats
@@ -0,0 +1,133 @@
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from .logs import get_logger
+
+# In-process counters and histograms, rendered in the Prometheus text format at
+# GET /metrics. Stage timings go through span():
+#
+#   with metrics.span("read", mime=mime):
+#       text, is_binary = read_text(drive, file_meta)
+#
+# which feeds folderheist_stage_seconds{stage=...} and, at DEBUG, logs the span.
+# Every series in that family carries the same SPAN_LABELS; unset ones are "".
+# Keep label values low-cardinality (labels, mime types, reasons; never file ids).
+
+STAGE_SECONDS = "folderheist_stage_seconds"
+SPAN_LABELS = ("mime", "kind", "feed")
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+HELP = {
+    STAGE_SECONDS: "Wall time per pipeline stage",
+    "folderheist_stage_errors_total": "Stages that raised",
+    "folderheist_files_routed_total": "Files handed to the move stage, by label, mime and decision source",
+    "folderheist_files_skipped_total": "Files not routed, by reason",
+    "folderheist_router_fallback_total": "Routing decisions that fell back to a cheaper answer, by reason",
+    "folderheist_router_tier_total": "Router tiers consulted",
+    "folderheist_changes_total": "Feed items fetched and accepted, by feed",
+    "folderheist_moves_total": "Move outcomes",
+    "folderheist_folders_created_total": "Label folders created during reconciliation",
+    "folderheist_throttled_total": "Throttling responses (429 / rate limit exceeded), by API",
+    "folderheist_requeued_total": "Files put back on the queue after a quota error",
+    "folderheist_backfill_files_total": "Backfill decisions, by action (move, in_place, skip, failed)",
+}
+
+_lock = threading.Lock()
+_counters: dict = {}     # (name, labels) -> value
+_histograms: dict = {}   # (name, labels) -> [bucket counts..., +Inf count, sum]
+_log = get_logger("span")
+
+def _key(name: str, labels: dict) -> tuple:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def inc(name: str, n: float = 1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + n
+
+def observe(name: str, value: float, **labels):
+    key = _key(name, labels)
+    i = bisect.bisect_left(BUCKETS, value)
+    with _lock:
+        h = _histograms.get(key)
+        if h is None:
+            h = _histograms[key] = [0] * (len(BUCKETS) + 2)
+        h[i] += 1
+        h[-1] += value
+
+@contextmanager
+def span(stage: str, **labels):
+    unknown = set(labels) - set(SPAN_LABELS)
+    if unknown:
+        raise TypeError(f"span() labels must be among {SPAN_LABELS}, got {sorted(unknown)}")
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        inc("folderheist_stage_errors_total", stage=stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        observe(STAGE_SECONDS, elapsed, stage=stage, **{k: labels.get(k, "") for k in SPAN_LABELS})
+        if _log.isEnabledFor(logging.DEBUG):
+            _log.debug("span", stage=stage, ms=round(elapsed * 1000, 2), **labels)
+
+# -- exposition ---------------------------------------------------------------
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _fmt_labels(labels, extra: tuple = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+def _header(lines: list, name: str, kind: str, help_text: str):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+
+def render(gauges: dict | None = None) -> str:
+    """Prometheus text exposition; `gauges` maps a prefix to a stats dict (e.g. queue_stats())."""
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((k, list(v)) for k, v in _histograms.items())
+
+    lines, seen = [], set()
+    for (name, labels), value in counters:
+        if name not in seen:
+            seen.add(name)
+            _header(lines, name, "counter", HELP.get(name, name))
+        lines.append(f"{name}{_fmt_labels(labels)} {value}")
+
+    for (name, labels), h in histograms:
+        if name not in seen:
+            seen.add(name)
+            _header(lines, name, "histogram", HELP.get(name, name))
+        cumulative = 0
+        for bound, n in zip(BUCKETS, h):
+            cumulative += n
+            lines.append(f"{name}_bucket{_fmt_labels(labels, (('le', repr(bound)),))} {cumulative}")
+        cumulative += h[len(BUCKETS)]
+        lines.append(f"{name}_bucket{_fmt_labels(labels, (('le', '+Inf'),))} {cumulative}")
+        lines.append(f"{name}_sum{_fmt_labels(labels)} {h[-1]}")
+        lines.append(f"{name}_count{_fmt_labels(labels)} {cumulative}")
+
+    # Existing stats dicts (/drive/queue etc.) as gauges, one level of nesting flattened
+    for prefix, stats in (gauges or {}).items():
+        for key, value in sorted(stats.items()):
+            if isinstance(value, dict):
+                for sub, v in sorted(value.items()):
+                    if isinstance(v, (int, float)) and not isinstance(v, bool):
+                        name = f"folderheist_{prefix}_{key}"
+                        if name not in seen:
+                            seen.add(name)
+                            _header(lines, name, "gauge", f"{prefix} {key}")
+                        lines.append(f"{name}{_fmt_labels((('key', str(sub)),))} {v}")
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                name = f"folderheist_{prefix}_{key}"
+                _header(lines, name, "gauge", f"{prefix} {key}")
+                lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,111 @@
+import argparse
+import hashlib
+import threading
+import time
+from config import LOCAL_MODEL_PATH, LOCAL_MODEL_MAX_PER_LABEL, FOLDER_MIME
+from local_model import training_model, publish_local_model
+from .content import read_text
+from .processing import FILE_FIELDS
+from .labels import catalog
+from .logs import get_logger
+from . import quota
+
+log = get_logger("model")
+
+_lock = threading.Lock()
+_status: dict = {}   # latest refresh in this process, for GET /drive/model/refresh
+
+# Trains the local routing tier from what is already filed: every label
+# folder's contents are examples of that label, plus each label's description.
+# Files seen in an earlier run are skipped, so refreshes are incremental.
+
+def _list_folder(drive, folder_id: str, limit: int):
+    page_token = None
+    fetched = 0
+    while fetched < limit:
+        resp = quota.execute(drive.files().list(
+            q=f"'{folder_id}' in parents and trashed = false and mimeType != '{FOLDER_MIME}'",
+            fields=f"nextPageToken,files({FILE_FIELDS})",
+            orderBy="modifiedTime desc",
+            pageSize=min(1000, limit - fetched),
+            pageToken=page_token,
+            includeItemsFromAllDrives=True, supportsAllDrives=True,
+        ))
+        for f in resp.get("files", []):
+            fetched += 1
+            yield f
+        page_token = resp.get("nextPageToken")
+        if not page_token:
+            break
+
+def refresh_local_model(drive, max_per_label: int = LOCAL_MODEL_MAX_PER_LABEL, full: bool = False) -> dict:
+    # train off to the side; the live model keeps routing until the swap
+    model = training_model(LOCAL_MODEL_PATH, full=full)
+    if model is None:
+        raise RuntimeError("NumPy is not installed; the local model tier is disabled.")
+
+    cat = catalog()
+    added = 0
+    for label, desc in cat.label_desc.items():
+        digest = hashlib.sha1(desc.encode("utf-8")).hexdigest()[:12]
+        added += model.add(label, label, desc, doc_id=f"desc:{label}:{digest}")
+
+    for label, folder_id in cat.label_to_id.items():
+        for f in _list_folder(drive, folder_id, max_per_label):
+            if f["id"] in model.seen:
+                continue
+            try:
+                text, _ = read_text(drive, f)
+            except Exception as e:
+                log.warning("Skipping training file", file=f.get("name", ""), file_id=f["id"], error=str(e))
+                continue
+            added += model.add(label, f.get("name", ""), text, doc_id=f["id"])
+
+    publish_local_model(model, LOCAL_MODEL_PATH)
+    log.info("Refreshed local model", added=added, documents=model.n_docs)
+    return {"added": added, **model.summary()}
+
+def start_refresh(full: bool = False) -> bool:
+    """Refresh on a background thread; False if one is already running here."""
+    with _lock:
+        if _status.get("state") == "running":
+            return False
+        _status.clear()
+        _status.update(state="running", full=full, started_at=time.time())
+
+    def _target():
+        from .drive_client import get_drive
+        from .labels import ensure_catalog
+        try:
+            drive = get_drive()
+            ensure_catalog(drive)
+            result = refresh_local_model(drive, full=full)
+        except Exception as e:
+            log.error("Local model refresh failed", error=str(e))
+            with _lock:
+                _status.update(state="failed", error=str(e))
+            return
+        with _lock:
+            _status.update(state="done", finished_at=time.time(), **result)
+
+    threading.Thread(target=_target, name="model-refresh", daemon=True).start()
+    return True
+
+def refresh_status() -> dict:
+    with _lock:
+        return dict(_status) or {"state": "idle"}
+
+def main():
+    parser = argparse.ArgumentParser(description="Train/refresh the local routing model from the label folders.")
+    parser.add_argument("--max-per-label", type=int, default=LOCAL_MODEL_MAX_PER_LABEL)
+    parser.add_argument("--full", action="store_true", help="discard the saved model and retrain from scratch")
+    args = parser.parse_args()
+
+    from .drive_client import get_drive
+    from .labels import ensure_catalog
+    drive = get_drive()
+    ensure_catalog(drive)
+    print(refresh_local_model(drive, args.max_per_label, full=args.full))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import threading
+from config import MOVE_BATCH_SIZE, MOVE_BATCH_WAIT, MOVE_MAX_RETRIES
+from .drive_client import get_drive, batch_execute, DRIVE_BATCH_LIMIT
+from . import metrics, quota
+from .logs import get_logger
+
+# Batched move stage: workers submit (file, target) pairs and a single flusher
+# thread coalesces them into Drive batch requests (max 100 calls per batch).
+
+log = get_logger("move")
+_pending: list = []
+_cv = threading.Condition()
+_flusher = None
+_listeners: list = []
+MOVE_STATS = {"submitted": 0, "moved": 0, "skipped": 0, "batches": 0, "retried": 0, "failed": 0}
+
+def on_move_finished(fn):
+    """Register fn(file_meta, ok) to run once a submitted move succeeds or is given up on."""
+    _listeners.append(fn)
+
+def _notify(file_meta: dict, ok: bool):
+    for fn in _listeners:
+        try:
+            fn(file_meta, ok)
+        except Exception as e:
+            log.error("Listener failed", file_id=file_meta.get("id"), error=str(e))
+
+def _update_request(drive, file_id: str, target_folder_id: str, parents: list):
+    return drive.files().update(
+        fileId=file_id,
+        addParents=target_folder_id,
+        removeParents=",".join(parents) if parents else "",
+        fields="id,parents",
+        supportsAllDrives=True,
+    )
+
+def move_file(drive, file_id: str, target_folder_id: str, parents: list | None = None):
+    """Single move; only pays the extra files().get when parents are unknown."""
+    if parents is None:
+        meta = quota.execute(drive.files().get(fileId=file_id, fields="parents", supportsAllDrives=True))
+        parents = meta.get("parents", [])
+    if target_folder_id in parents:
+        return
+    quota.execute(_update_request(drive, file_id, target_folder_id, parents), "drive_write")
+
+def move_batch(drive, items: list) -> list:
+    """Move (file_meta, target_folder_id, attempt) items with as few HTTP calls as possible.
+
+    Returns the failed items as (file_meta, target_folder_id, attempt, error).
+    """
+    failures = []
+    todo = []
+    for item in items:
+        file_meta, target_id, _ = item
+        if target_id in (file_meta.get("parents") or []):
+            MOVE_STATS["skipped"] += 1
+            metrics.inc("folderheist_moves_total", outcome="already_there")
+            _notify(file_meta, True)
+            continue
+        todo.append(item)
+
+    batched = {}
+    for i, (file_meta, target_id, attempt) in enumerate(todo):
+        if "parents" in file_meta:
+            batched[str(i)] = (file_meta, target_id, attempt)
+            continue
+        # No parents in the change payload: fall back to the two-call path
+        try:
+            with metrics.span("move_single"):
+                move_file(drive, file_meta["id"], target_id)
+            MOVE_STATS["moved"] += 1
+            metrics.inc("folderheist_moves_total", outcome="moved")
+            _notify(file_meta, True)
+        except Exception as e:
+            failures.append((file_meta, target_id, attempt, e))
+    if not batched:
+        return failures
+
+    requests = {key: _update_request(drive, fm["id"], tid, fm["parents"]) for key, (fm, tid, _) in batched.items()}
+    with metrics.span("move_batch"):
+        # a batch that fails as a whole (network, auth) reports every item it carried, so all are retried
+        moved, errors = batch_execute(drive, requests, "drive_write")
+    MOVE_STATS["batches"] += -(-len(requests) // DRIVE_BATCH_LIMIT)
+    for key, (file_meta, target_id, attempt) in batched.items():
+        if key in moved:
+            MOVE_STATS["moved"] += 1
+            metrics.inc("folderheist_moves_total", outcome="moved")
+            _notify(file_meta, True)
+        else:
+            failures.append((file_meta, target_id, attempt, errors.get(key)))
+    return failures
+
+def submit_move(file_meta: dict, target_folder_id: str, attempt: int = 0, resubmit: bool = False):
+    _ensure_flusher()
+    with _cv:
+        _pending.append((file_meta, target_folder_id, attempt))
+        if attempt == 0 and not resubmit:
+            MOVE_STATS["submitted"] += 1
+        if len(_pending) >= MOVE_BATCH_SIZE:
+            _cv.notify()
+
+def _retry_later(file_meta: dict, target_id: str, attempt: int, error):
+    fid = file_meta.get("id")
+    delay = quota.backoff(attempt, error)
+    if quota.is_throttle(error):
+        # over quota is not a failure: wait it out without spending a retry
+        log.info("Move throttled, requeued", file_id=fid, delay_s=round(delay, 2))
+        metrics.inc("folderheist_requeued_total", stage="move")
+        t = threading.Timer(delay, submit_move, args=(file_meta, target_id, attempt, True))
+        t.daemon = True
+        t.start()
+        return
+    if attempt >= MOVE_MAX_RETRIES:
+        log.error("Move failed, giving up", file_id=fid, folder_id=target_id, error=str(error))
+        MOVE_STATS["failed"] += 1
+        metrics.inc("folderheist_moves_total", outcome="failed")
+        _notify(file_meta, False)
+        return
+    log.warning("Retrying move", file_id=fid, attempt=attempt + 1, max_retries=MOVE_MAX_RETRIES, error=str(error))
+    MOVE_STATS["retried"] += 1
+    metrics.inc("folderheist_moves_total", outcome="retried")
+    t = threading.Timer(delay, submit_move, args=(file_meta, target_id, attempt + 1))
+    t.daemon = True
+    t.start()
+
+def _flusher_loop():
+    while True:
+        with _cv:
+            if len(_pending) < MOVE_BATCH_SIZE:
+                _cv.wait(timeout=MOVE_BATCH_WAIT)
+            items = _pending[:DRIVE_BATCH_LIMIT]
+            del _pending[:len(items)]
+        if not items:
+            continue
+        try:
+            failures = move_batch(get_drive(), items)
+        except Exception as e:
+            failures = [(fm, tid, att, e) for fm, tid, att in items]
+        for file_meta, target_id, attempt, error in failures:
+            _retry_later(file_meta, target_id, attempt, error)
+
+def _ensure_flusher():
+    global _flusher
+    with _cv:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flusher_loop, name="move-flusher", daemon=True)
+            _flusher.start()
+
+def move_stats() -> dict:
+    with _cv:
+        pending = len(_pending)
+    return {**MOVE_STATS, "pending": pending}
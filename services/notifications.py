@@ -1,138 +1,106 @@
-import uuid
-from datetime import datetime, timezone
 from flask import request, make_response
-from config import (
-    APP_URL, WEBHOOK_ENDPOINT, FOLDER_MIME,
-    DRIVE_FOLDER_ID, FOLDER_CATALOG_CSV, DRIVE_PARENT_ID
-)
-from state import LABEL_TO_ID, LABEL_DESC, ALLOWED, LABEL_FOLDER_IDS
-from .drive_client import (
-    get_drive, read_start_page_token, write_start_page_token,
-    save_watch_info, load_watch_info
-)
-from .processing import process_file
-from .folder_catalog import ensure_folders_from_csv
-from .labels import hydrate_labels
+from config import WEBHOOK_ENDPOINT, BACKFILL_CONCURRENCY, BACKFILL_MAX_CONCURRENCY
+from .drive_client import get_drive, client_stats
+from .worker import request_drain, queue_stats
+from .backfill import start_backfill, backfill_status
+from . import journal
+from .classify_cache import cache_stats
+from .moves import move_stats
+from .pdf_text import pdf_stats
+from .media import media_stats
+from .model_training import start_refresh, refresh_status
+from .labels import hydrate_labels, catalog
+from . import channels, metrics, quota
+from ai_router import GEMINI_STATS
 
 def register_routes(app):
     @app.route("/drive/start-watch", methods=["POST"])
     def start_watch():
         drive = get_drive()
+        # Ensure label folders exist & publish their IDs
         hydrate_labels(drive)
-        # Ensure label folders exist & cache their IDs
-        global LABEL_TO_ID, LABEL_DESC, ALLOWED, LABEL_FOLDER_IDS
-        label_to_id, label_desc, allowed = ensure_folders_from_csv(drive, FOLDER_CATALOG_CSV, DRIVE_PARENT_ID)
-        LABEL_TO_ID.clear(); LABEL_TO_ID.update(label_to_id)
-        LABEL_DESC.clear(); LABEL_DESC.update(label_desc)
-        ALLOWED.clear(); ALLOWED.extend(allowed)
-        LABEL_FOLDER_IDS.clear(); LABEL_FOLDER_IDS.update(LABEL_TO_ID.values())
 
-        channel_id = str(uuid.uuid4())
-        address = f"{APP_URL}{WEBHOOK_ENDPOINT}"
-        body = {"id": channel_id, "type": "web_hook", "address": address}
-        resp = drive.changes().watch(
-            body=body,
-            pageToken=read_start_page_token(drive),
-            includeItemsFromAllDrives=True,
-            supportsAllDrives=True,
-        ).execute()
-
-        info = {
-            "id": resp["id"],
-            "resourceId": resp["resourceId"],
-            "expiration": resp.get("expiration"),
-            "address": address,
-            "createdAt": datetime.now(timezone.utc).isoformat(),
-        }
-        save_watch_info(info)
-        return {"status": "watching", "channel": info}, 200
+        # older channels keep delivering until the scheduler retires them
+        info = channels.register_channel(drive)
+        channels.start_scheduler()
+        return {"status": "watching", "channel": info, "channels": len(channels.load_channels())}, 200
 
     @app.route("/drive/stop-watch", methods=["POST"])
     def stop_watch():
-        info = load_watch_info()
-        if not info:
+        if not channels.load_channels():
             return {"status": "no-active-channel"}, 200
-        drive = get_drive()
-        drive.channels().stop(body={"id": info["id"], "resourceId": info["resourceId"]}).execute()
-        save_watch_info({})
-        return {"status": "stopped"}, 200
+        stopped = channels.stop_all(get_drive())
+        return {"status": "stopped", "channels": stopped}, 200
 
     @app.route(WEBHOOK_ENDPOINT, methods=["POST"])
     def drive_notifications():
-        if not ALLOWED or not LABEL_TO_ID:
-            hydrate_labels(drive)
-        try:
-            info = load_watch_info()
-            if not info:
-                return "No channel", 200
-            if request.headers.get("X-Goog-Channel-ID") != info.get("id"):
-                return "Mismatched channel", 200
-            if request.headers.get("X-Goog-Resource-ID") != info.get("resourceId"):
-                return "Mismatched resource", 200
+        # Only validate + record; the drainer/worker pool does the heavy lifting
+        if not channels.is_known(request.headers.get("X-Goog-Channel-ID"),
+                                 request.headers.get("X-Goog-Resource-ID"),
+                                 request.headers.get("X-Goog-Channel-Token")):
+            return "Unknown channel", 200
+        if request.headers.get("X-Goog-Resource-State") == "sync":
+            return "OK", 200   # sent once when a channel opens; nothing changed
 
-            drive = get_drive()
-        except Exception as e:
-            print(f"[AUTH] Drive not ready ({e}). Ack to prevent retries.")
-            return "OK", 200
+        request_drain()
+        return make_response("OK", 200)
 
-        page_token = read_start_page_token(drive)
-        while page_token:
-            resp = drive.changes().list(
-                pageToken=page_token,
-                fields="nextPageToken,newStartPageToken,changes(fileId,file,removed,time)",
-                includeItemsFromAllDrives=True,
-                supportsAllDrives=True,
-            ).execute()
+    @app.route("/drive/queue", methods=["GET"])
+    def http_queue_stats():
+        return {**queue_stats(), "moves": move_stats(), "pdf": pdf_stats(), "media": media_stats(),
+                "watch": channels.watch_stats(), "journal": journal.journal_stats(), "quota": quota.quota_stats()}, 200
 
-            for ch in resp.get("changes", []):
-                if ch.get("removed"):
-                    continue
-                file = ch.get("file") or {}
-                fid = file.get("id")
-                mime = file.get("mimeType", "")
-                name = file.get("name", "")
-                if not fid:
-                    continue
+    @app.route("/drive/backfill", methods=["POST"])
+    def http_backfill():
+        raw = request.args.get("concurrency") or str(BACKFILL_CONCURRENCY)
+        if not raw.isdecimal() or int(raw) < 1:
+            return {"status": "bad-request", "error": "concurrency must be a positive integer"}, 400
+        started = start_backfill(
+            run=request.args.get("run") or None,
+            dry_run=request.args.get("dry_run") == "1",
+            reorganize=request.args.get("reorganize") == "1",
+            concurrency=min(int(raw), BACKFILL_MAX_CONCURRENCY),
+        )
+        if not started:
+            return {"status": "already-running", **backfill_status()}, 409
+        return {"status": "started"}, 202
 
-                if fid in LABEL_FOLDER_IDS:
-                    print(f"[SKIP] Label folder change: {name} ({fid})"); continue
-                if mime == FOLDER_MIME:
-                    print(f"[SKIP] Folder item: {name} ({fid})"); continue
+    @app.route("/drive/backfill", methods=["GET"])
+    def http_backfill_status():
+        return backfill_status(), 200
 
-                # only handle items inside the watched folder
-                parents = file.get("parents", [])
-                if DRIVE_FOLDER_ID and DRIVE_FOLDER_ID not in parents:
-                    continue
+    @app.route("/drive/cache", methods=["GET"])
+    def http_cache_stats():
+        return cache_stats(), 200
 
-                if mime.startswith("application/vnd.google-apps.") and mime not in {
-                    "application/vnd.google-apps.document",
-                    "application/vnd.google-apps.spreadsheet",
-                }:
-                    print(f"[SKIP] Non-exportable Google item: {name} ({mime})")
-                    continue
+    @app.route("/drive/model/refresh", methods=["POST"])
+    def http_model_refresh():
+        if not start_refresh(full=request.args.get("full") == "1"):
+            return {"status": "already-running", **refresh_status()}, 409
+        return {"status": "started"}, 202
 
-                try:
-                    process_file(drive, file)
-                except Exception as e:
-                    print(f"[WARN] Processing error for {fid}: {e}")
-                    continue
+    @app.route("/drive/model/refresh", methods=["GET"])
+    def http_model_refresh_status():
+        return refresh_status(), 200
 
-            page_token = resp.get("nextPageToken")
-            if not page_token:
-                new_start = resp.get("newStartPageToken")
-                if new_start:
-                    write_start_page_token(new_start)
-                break
+    @app.route("/drive/clients", methods=["GET"])
+    def http_client_stats():
+        return {**client_stats(), "gemini": dict(GEMINI_STATS)}, 200
 
-        return make_response("OK", 200)
+    @app.route("/metrics", methods=["GET"])
+    def http_metrics():
+        body = metrics.render({
+            "queue": queue_stats(), "moves": move_stats(), "pdf": pdf_stats(), "media": media_stats(),
+            "cache": cache_stats(), "clients": client_stats(), "gemini": dict(GEMINI_STATS),
+            "journal": journal.journal_stats(), "quota": quota.quota_stats(), "watch": channels.watch_stats(),
+        })
+        resp = make_response(body, 200)
+        resp.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+        return resp
 
     @app.route("/drive/ensure-folders", methods=["POST"])
     def http_ensure_folders():
         drive = get_drive()
-        global LABEL_TO_ID, LABEL_DESC, ALLOWED, LABEL_FOLDER_IDS
-        label_to_id, label_desc, allowed = ensure_folders_from_csv(drive, FOLDER_CATALOG_CSV, DRIVE_PARENT_ID)
-        LABEL_TO_ID.clear(); LABEL_TO_ID.update(label_to_id)
-        LABEL_DESC.clear(); LABEL_DESC.update(label_desc)
-        ALLOWED.clear(); ALLOWED.extend(allowed)
-        LABEL_FOLDER_IDS.clear(); LABEL_FOLDER_IDS.update(LABEL_TO_ID.values())
-        return {"ok": True, "labels": ALLOWED, "count": len(ALLOWED)}, 200
+        hydrate_labels(drive)
+        cat = catalog()
+        return {"ok": True, "labels": list(cat.allowed), "count": len(cat.allowed), "version": cat.version}, 200
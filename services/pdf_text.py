@@ -0,0 +1,160 @@
+import multiprocessing
+import threading
+import time
+from concurrent.futures import CancelledError, ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from config import PDF_BACKEND, PDF_MAX_PAGES, PDF_PROCESS_WORKERS, PDF_TIMEOUT
+from .logs import get_logger
+
+# Pluggable, budgeted PDF text extraction. Pages are pulled lazily from the
+# fastest installed backend and extraction stops as soon as the character or
+# page budget is met. CPU-heavy work runs in a process pool (spawned, so it is
+# safe alongside the worker threads) to keep the GIL free for the web app.
+
+def _pages_pypdfium2(path):
+    import pypdfium2 as pdfium
+    pdf = pdfium.PdfDocument(path)
+    try:
+        for i in range(len(pdf)):
+            page = pdf[i]
+            textpage = page.get_textpage()
+            try:
+                yield textpage.get_text_range()
+            finally:
+                textpage.close()
+                page.close()
+    finally:
+        pdf.close()
+
+def _pages_pdfminer(path):
+    from pdfminer.high_level import extract_pages
+    from pdfminer.layout import LTTextContainer
+    for layout in extract_pages(path):
+        yield "".join(el.get_text() for el in layout if isinstance(el, LTTextContainer))
+
+def _pages_pypdf2(path):
+    import PyPDF2
+    reader = PyPDF2.PdfReader(path)
+    for page in reader.pages:
+        yield page.extract_text() or ""
+
+BACKENDS = {
+    "pypdfium2": ("pypdfium2", _pages_pypdfium2),
+    "pdfminer": ("pdfminer", _pages_pdfminer),
+    "pypdf2": ("PyPDF2", _pages_pypdf2),
+}
+
+if PDF_BACKEND != "auto" and PDF_BACKEND not in BACKENDS:
+    raise RuntimeError(f"PDF_BACKEND must be auto or one of {', '.join(BACKENDS)} (got {PDF_BACKEND!r}).")
+
+def _installed(module: str) -> bool:
+    try:
+        __import__(module)
+        return True
+    except Exception:
+        return False
+
+def pick_backend(preferred: str = "auto") -> str:
+    if preferred != "auto":
+        return preferred
+    for name, (module, _) in BACKENDS.items():   # ordered fastest first
+        if _installed(module):
+            return name
+    return "pypdf2"
+
+def extract_path(path: str, backend: str, max_chars: int, max_pages: int) -> tuple[str, int, float]:
+    """Return (text, pages_read, seconds). Runs in the pool, so arguments stay picklable."""
+    started = time.perf_counter()
+    parts, total, pages = [], 0, 0
+    for page_text in BACKENDS[backend][1](path):
+        parts.append(page_text)
+        total += len(page_text) + 1
+        pages += 1
+        if total >= max_chars or (max_pages and pages >= max_pages):
+            break
+    return "\n".join(parts)[:max_chars], pages, time.perf_counter() - started
+
+log = get_logger("pdf")
+_pool = None
+_pool_lock = threading.Lock()
+_backend = None
+PDF_STATS = {"documents": 0, "failed": 0, "recycled": 0, "pages": 0, "seconds": 0.0, "max_seconds": 0.0}
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None and PDF_PROCESS_WORKERS > 0:
+            _pool = ProcessPoolExecutor(
+                max_workers=PDF_PROCESS_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+def _recycle_pool(pool):
+    """Drop a pool whose worker is stuck on a pathological PDF.
+
+    Giving up on .result() leaves the extraction running, so the worker
+    processes are terminated too; the next document starts a fresh pool.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not pool:
+            return   # another thread already replaced it
+        _pool = None
+        PDF_STATS["recycled"] += 1
+    pool.shutdown(wait=False, cancel_futures=True)
+    terminate = getattr(pool, "terminate_workers", None)   # Python 3.14+
+    if terminate is not None:
+        terminate()
+    else:
+        for proc in list((getattr(pool, "_processes", None) or {}).values()):
+            proc.terminate()
+
+def _extract(path: str, max_chars: int, retry: bool = True) -> tuple[str, int, float]:
+    pool = _get_pool()
+    if pool is None:
+        return extract_path(path, _backend, max_chars, PDF_MAX_PAGES)
+    try:
+        return pool.submit(extract_path, path, _backend, max_chars, PDF_MAX_PAGES).result(timeout=PDF_TIMEOUT)
+    except TimeoutError:
+        _recycle_pool(pool)
+        raise
+    except (BrokenProcessPool, CancelledError):
+        # caught in another document's recycle: this one deserves a fresh pool
+        if not retry:
+            raise
+        _recycle_pool(pool)
+        return _extract(path, max_chars, retry=False)
+
+def extract_pdf_text(path: str, max_chars: int, name: str = "") -> str:
+    global _backend
+    if _backend is None:
+        _backend = pick_backend(PDF_BACKEND)
+    try:
+        text, pages, secs = _extract(path, max_chars)
+    except TimeoutError:
+        log.warning("Extraction timed out; restarted the PDF pool", file=name, timeout_s=PDF_TIMEOUT)
+        with _pool_lock:
+            PDF_STATS["failed"] += 1
+        return ""
+    except Exception as e:
+        log.warning("Extraction failed", file=name, error=str(e))
+        with _pool_lock:
+            PDF_STATS["failed"] += 1
+        return ""
+
+    with _pool_lock:
+        PDF_STATS["documents"] += 1
+        PDF_STATS["pages"] += pages
+        PDF_STATS["seconds"] += secs
+        PDF_STATS["max_seconds"] = max(PDF_STATS["max_seconds"], secs)
+    log.debug("Extracted", file=name, pages=pages, chars=len(text), backend=_backend, ms=round(secs * 1000))
+    return text
+
+def pdf_stats() -> dict:
+    with _pool_lock:
+        stats = dict(PDF_STATS)
+    stats["backend"] = _backend or pick_backend(PDF_BACKEND)
+    stats["avg_seconds"] = round(stats["seconds"] / stats["documents"], 4) if stats["documents"] else 0.0
+    stats["seconds"] = round(stats["seconds"], 3)
+    return stats
@@ -1,109 +1,109 @@
-import io
-from googleapiclient.http import MediaIoBaseDownload
-from config import FOLDER_MIME, CONF_THRESHOLD
-from state import LABEL_TO_ID, LABEL_DESC, ALLOWED
+import time
+from functools import partial
+from config import FOLDER_MIME, CONF_THRESHOLD, LOCAL_MODEL_PATH
 from ai_router import choose_folder_with_gemini
+from local_model import get_local_model
+from . import classify_cache
+from .moves import submit_move
+from .content import read_text
+from .media import wants_preview, media_hint, read_media, MEDIA_FIELDS
+from .labels import catalog
+from . import metrics
+from .logs import get_logger
 
-def try_extract_pdf_text(pdf_bytes: bytes) -> str:
-    try:
-        import PyPDF2
-        reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
-        return "\n".join([(p.extract_text() or "") for p in reader.pages])
-    except Exception as e:
-        print("[PDF] extraction failed:", e)
-        return ""
+log = get_logger("process")
+
+# Everything process_file reads from a file resource; request exactly this from Drive
+FILE_FIELDS = "id,name,mimeType,parents,size,md5Checksum,sha256Checksum,trashed," + MEDIA_FIELDS
 
 def handle_text(filename, text):   # simple demo hook
-    print(f"[TEXT] {filename}: {len(text)} chars")
+    log.debug("Text extracted", file=filename, chars=len(text))
 
-def handle_binary(filename, blob): # simple demo hook
-    print(f"[BINARY] {filename}: {len(blob)} bytes")
+def handle_binary(filename, size): # simple demo hook
+    log.debug("Binary, not downloaded", file=filename, bytes=size)
 
-def move_file(drive, file_id: str, target_folder_id: str):
-    meta = drive.files().get(fileId=file_id, fields="parents").execute()
-    parents = meta.get("parents", [])
-    if target_folder_id in parents:
-        return
-    prev_parents = ",".join(parents) if parents else ""
-    drive.files().update(
-        fileId=file_id,
-        addParents=target_folder_id,
-        removeParents=prev_parents,
-        fields="id,parents",
-    ).execute()
-
-def process_file(drive, file_meta):
+def process_file(drive, file_meta, move: bool = True) -> dict | None:
+    """Classify one file and, unless move=False (dry runs), hand it to the move stage.
+
+    Returns the decision {label, folder_id, confidence, source}, or None if skipped.
+    """
+    mime = file_meta.get("mimeType", "")
+    with metrics.span("process", mime=mime):
+        decision = _process_file(drive, file_meta, mime)
+        if decision and move:
+            submit_move(file_meta, decision["folder_id"])
+            metrics.inc("folderheist_files_routed_total", label=decision["label"], mime=mime, source=decision["source"])
+    if decision:
+        log.info("Routed" if move else "Would route", file=file_meta.get("name", ""), file_id=file_meta["id"],
+                 label=decision["label"], folder_id=decision["folder_id"],
+                 confidence=round(decision["confidence"], 2), source=decision["source"])
+    return decision
+
+def _decision(label: str, folder_id: str, confidence: float, source: str) -> dict:
+    return {"label": label, "folder_id": folder_id, "confidence": confidence, "source": source}
+
+def _process_file(drive, file_meta, mime: str) -> dict | None:
     file_id = file_meta["id"]
     name = file_meta.get("name", "")
-    mime = file_meta.get("mimeType", "")
 
-    print(f"[PROCESS] {name} ({file_id}) type={mime}")
+    log.debug("Processing", file=name, file_id=file_id, mime=mime)
 
     if mime == FOLDER_MIME:
-        print(f"[SKIP] Not a file: folder '{name}'")
+        log.info("Not a file, skipping folder", file=name, file_id=file_id)
+        metrics.inc("folderheist_files_skipped_total", reason="folder")
         return
 
-    text, content, is_binary = "", None, False
-
-    if mime == "application/vnd.google-apps.document":
-        data = drive.files().export(fileId=file_id, mimeType="text/plain").execute()
-        text = data.decode("utf-8", errors="ignore")
-
-    elif mime == "application/vnd.google-apps.spreadsheet":
-        data = drive.files().export(fileId=file_id, mimeType="text/csv").execute()
-        text = data.decode("utf-8", errors="ignore")
-
-    else:
-        buf = io.BytesIO()
-        req = drive.files().get_media(fileId=file_id)
-        downloader = MediaIoBaseDownload(buf, req)
-        done = False
-        while not done:
-            _, done = downloader.next_chunk()
-        content = buf.getvalue()
-
-        if mime == "application/pdf":
-            text = try_extract_pdf_text(content)
-        elif mime.startswith("text/"):
-            try:
-                text = content.decode("utf-8", errors="ignore")
-            except Exception:
-                is_binary = True
-        else:
-            is_binary = True
+    started = time.monotonic()
+    cat = catalog()   # one snapshot for the whole file, even if a hydrate lands meanwhile
+    cache_key = classify_cache.content_key(file_meta, cat.version)
+    if cache_key:
+        with metrics.span("cache_lookup"):
+            cached = classify_cache.get(cache_key)
+        if cached and cached["label"] in cat.label_to_id:
+            return _decision(cached["label"], cat.label_to_id[cached["label"]], cached["confidence"], "cache")
+
+    with metrics.span("read", mime=mime):
+        text, is_binary = read_text(drive, file_meta)
+
+    media = None
+    if wants_preview(file_meta, text):
+        text = "\n".join(filter(None, (text, media_hint(file_meta))))
+        media = partial(read_media, drive, file_meta)   # OCR / preview only if the cheap tiers fail
 
     if text:
         handle_text(name, text)
-    elif is_binary and content is not None:
-        handle_binary(name, content)
-
-    result = choose_folder_with_gemini(
-        filename=name,
-        text=text or "",
-        allowed_labels=ALLOWED,
-        label_desc=LABEL_DESC,
-    )
-    label = (result or {}).get("label")
-    conf = float((result or {}).get("confidence") or 0.0)
-
-    if label not in LABEL_TO_ID or conf < CONF_THRESHOLD:
-        low = name.lower()
-        if "invoice" in low or "receipt" in low:
-            label = "Invoices" if "Invoices" in LABEL_TO_ID else label
-        elif any(k in low for k in ["transcript", "grade", "gpa"]):
-            label = "Academics" if "Academics" in LABEL_TO_ID else label
-        elif any(k in low for k in ["passport", "license", " id "]):
-            label = "IDs" if "IDs" in LABEL_TO_ID else label
-
-        if label not in LABEL_TO_ID:
-            fallback = "Misc" if "Misc" in LABEL_TO_ID else next(iter(ALLOWED), None)
-            label = fallback
-
-    if not label or label not in LABEL_TO_ID:
-        print(f"[WARN] No valid label for {name}; ALLOWED={len(ALLOWED)}. Skipping move.")
+    elif is_binary:
+        handle_binary(name, int(file_meta.get("size") or 0))
+
+    with metrics.span("classify"):
+        result = choose_folder_with_gemini(
+            filename=name,
+            text=text or "",
+            allowed_labels=list(cat.allowed),
+            label_desc=cat.label_desc,
+            matcher=cat.matcher,
+            local_model=get_local_model(LOCAL_MODEL_PATH),
+            conf_threshold=CONF_THRESHOLD,
+            file_id=file_id,
+            media=media,
+        ) or {}
+    label = result.get("label")
+    conf = float(result.get("confidence") or 0.0)
+    source = result.get("source", "none")
+
+    if label not in cat.label_to_id:
+        metrics.inc("folderheist_router_fallback_total", reason="label_not_in_catalog")
+        label = "Misc" if "Misc" in cat.label_to_id else next(iter(cat.allowed), None)
+        source = "default"
+
+    if not label or label not in cat.label_to_id:
+        log.warning("No valid label, skipping move", file=name, file_id=file_id, allowed=len(cat.allowed))
+        metrics.inc("folderheist_files_skipped_total", reason="no_label")
         return
 
 
-    target_id = LABEL_TO_ID[label]
-    move_file(drive, file_id, target_id)
-    print(f"[ROUTE] {name} -> {label} ({target_id}) @ conf={conf:.2f}")
+    if cache_key and conf >= CONF_THRESHOLD:
+        classify_cache.put(cache_key, label, conf, result.get("rationale", ""),
+                           miss_seconds=time.monotonic() - started, source=source)
+
+    return _decision(label, cat.label_to_id[label], conf, source)
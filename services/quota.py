@@ -0,0 +1,192 @@
+import email.utils
+import random
+import re
+import threading
+import time
+from config import DRIVE_READ_QPS, DRIVE_WRITE_QPS, GEMINI_QPS, QUOTA_MAX_RETRIES, QUOTA_BACKOFF_MAX, RETRY_BACKOFF_BASE
+from . import metrics
+from .logs import get_logger
+
+# Shared, adaptive rate limits per upstream API. Every Drive / Gemini call goes
+# through call() (or execute() for a googleapiclient request):
+#
+#   quota.execute(drive.files().get(...), "drive_read")
+#   quota.call("gemini", lambda: client.models.generate_content(...))
+#
+# A throttling error (429, 403 rateLimitExceeded, RESOURCE_EXHAUSTED) halves
+# that API's rate and pauses it for Retry-After; the rate then climbs back
+# linearly. Throttling and transient (5xx) errors are retried here with
+# exponential backoff and full jitter; if they persist, QuotaExceeded / the
+# original error reaches the worker, which requeues the file.
+
+log = get_logger("quota")
+
+RECOVERY_PER_SEC = 0.05   # share of the configured rate regained per second after a cut
+MIN_RATE_SHARE = 0.05     # never go below this share of the configured rate
+_RATE_LIMIT_REASONS = ("ratelimitexceeded", "userratelimitexceeded", "quotaexceeded", "resource_exhausted")
+
+class QuotaExceeded(Exception):
+    """Still throttled after QUOTA_MAX_RETRIES; `retry_after` is the suggested wait in seconds."""
+
+    def __init__(self, api: str, retry_after: float, cause: Exception):
+        super().__init__(f"{api} throttled: {cause}")
+        self.api, self.retry_after, self.cause = api, retry_after, cause
+
+class TokenBucket:
+    def __init__(self, name: str, rate: float):
+        self.name = name
+        self.max_rate = rate
+        self.capacity = max(1.0, rate)        # one second of burst
+        self._rate_at_cut = rate
+        self._cut_at = 0.0
+        self._paused_until = 0.0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.stats = {"acquired": 0, "throttled": 0, "rate_cuts": 0, "wait_seconds": 0.0}
+
+    def rate(self, now: float | None = None) -> float:
+        now = time.monotonic() if now is None else now
+        recovered = self._rate_at_cut + (now - self._cut_at) * RECOVERY_PER_SEC * self.max_rate
+        return min(self.max_rate, recovered)
+
+    def acquire(self, cost: float = 1.0):
+        """Block until `cost` tokens are available. Costs above capacity go into debt."""
+        if self.max_rate <= 0:
+            return
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                rate = self.rate(now)
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * rate)
+                self._updated = now
+                need = min(cost, self.capacity)
+                if now >= self._paused_until and self._tokens >= need:
+                    self._tokens -= cost
+                    self.stats["acquired"] += 1
+                    self.stats["wait_seconds"] += waited
+                    return
+                delay = max(self._paused_until - now, (need - self._tokens) / rate)
+            time.sleep(delay)
+            waited += delay
+
+    def throttled(self, retry_after: float | None):
+        with self._lock:
+            now = time.monotonic()
+            self.stats["throttled"] += 1
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+            # one cut per burst of 429s, not one per in-flight request
+            if self.max_rate > 0 and now - self._cut_at >= 1.0:
+                self._rate_at_cut = max(self.rate(now) / 2, self.max_rate * MIN_RATE_SHARE)
+                self._cut_at = now
+                self._tokens = min(self._tokens, 0.0)
+                self.stats["rate_cuts"] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["rate"] = round(self.rate(), 3)
+            stats["max_rate"] = self.max_rate
+            stats["paused_s"] = round(max(0.0, self._paused_until - time.monotonic()), 2)
+        stats["wait_seconds"] = round(stats["wait_seconds"], 2)
+        return stats
+
+LIMITERS = {
+    "drive_read": TokenBucket("drive_read", DRIVE_READ_QPS),
+    "drive_write": TokenBucket("drive_write", DRIVE_WRITE_QPS),
+    "gemini": TokenBucket("gemini", GEMINI_QPS),
+}
+
+# -- error classification -----------------------------------------------------
+
+def _status(exc) -> int | None:
+    resp = getattr(exc, "resp", None)          # googleapiclient HttpError
+    if resp is not None and getattr(resp, "status", None):
+        return int(resp.status)
+    code = getattr(exc, "code", None)          # google.genai APIError
+    return code if isinstance(code, int) else None
+
+def is_throttle(exc) -> bool:
+    if isinstance(exc, QuotaExceeded):
+        return True
+    status = _status(exc)
+    if status == 429:
+        return True
+    text = str(exc).lower()
+    if status == 403:
+        return any(r in text for r in _RATE_LIMIT_REASONS)
+    return status is None and "resource_exhausted" in text
+
+def is_transient(exc) -> bool:
+    status = _status(exc)
+    return status is not None and status >= 500
+
+def retry_after(exc) -> float | None:
+    """Server-suggested wait from a Retry-After header or a Gemini retryDelay."""
+    if isinstance(exc, QuotaExceeded):
+        return exc.retry_after
+    headers = getattr(exc, "resp", None)
+    if headers is None:
+        headers = getattr(getattr(exc, "response", None), "headers", None)
+    value = None
+    if headers is not None:
+        value = headers.get("retry-after") or headers.get("Retry-After")
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    m = re.search(r"retryDelay['\"]?\s*[:=]\s*['\"]?(\d+(?:\.\d+)?)s", str(getattr(exc, "details", "") or exc))
+    return float(m.group(1)) if m else None
+
+def backoff(attempt: int, exc=None) -> float:
+    """Exponential backoff with full jitter, never shorter than Retry-After."""
+    delay = random.uniform(0, min(QUOTA_BACKOFF_MAX, RETRY_BACKOFF_BASE * (2 ** attempt)))
+    hinted = retry_after(exc) if exc is not None else None
+    return max(delay, hinted or 0.0)
+
+# -- calls --------------------------------------------------------------------
+
+def observe(api: str, exc):
+    """Feed an error that was not raised through call() (e.g. a batch item) to the limiter."""
+    if is_throttle(exc):
+        LIMITERS[api].throttled(retry_after(exc))
+        metrics.inc("folderheist_throttled_total", api=api)
+
+def call(api: str, fn, cost: float = 1.0, retries: int = QUOTA_MAX_RETRIES):
+    limiter = LIMITERS[api]
+    attempt = 0
+    while True:
+        limiter.acquire(cost)
+        try:
+            return fn()
+        except Exception as e:
+            throttle = is_throttle(e)
+            if not throttle and not is_transient(e):
+                raise
+            observe(api, e)
+            delay = backoff(attempt, e)
+            if attempt >= retries:
+                if throttle:
+                    raise QuotaExceeded(api, delay, e) from e
+                raise
+            attempt += 1
+            log.warning("Retrying after upstream error", api=api, attempt=attempt,
+                        delay_s=round(delay, 2), throttled=throttle, error=str(e))
+            time.sleep(delay)
+
+def execute(request, api: str = "drive_read", retries: int = QUOTA_MAX_RETRIES):
+    return call(api, request.execute, retries=retries)
+
+def execute_batch(batch, api: str, size: int):
+    """One batch HTTP call that costs `size` tokens. Not retried as a whole: its
+    callbacks would fire twice. Callers retry failed items and report them via observe()."""
+    return call(api, batch.execute, cost=size, retries=0)
+
+def quota_stats() -> dict:
+    return {name: limiter.snapshot() for name, limiter in LIMITERS.items()}
@@ -0,0 +1,282 @@
+import json
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from config import (
+    FOLDER_MIME, DRIVE_FOLDER_ID,
+    WORKER_CONCURRENCY, QUEUE_MAXSIZE, PROCESS_MAX_RETRIES,
+    DRAIN_DEBOUNCE_SECONDS, DRAIN_MAX_DELAY, CHANGE_FEED, FOLDER_POLL_SECONDS, FOLDER_SWEEP_SECONDS,
+    JOURNAL_LEASE_SECONDS,
+)
+from .drive_client import get_drive, read_start_page_token
+from . import journal
+from .moves import on_move_finished
+from .processing import process_file
+from .feeds import iter_change_pages, iter_folder_pages, iter_folder_sweep
+from .labels import catalog, ensure_catalog
+from . import metrics, quota
+from .logs import get_logger
+from ai_router import add_batch_callers
+
+EXPORTABLE_GOOGLE_MIMES = {
+    "application/vnd.google-apps.document",
+    "application/vnd.google-apps.spreadsheet",
+}
+
+log = get_logger("worker")
+
+_jobs: queue.Queue = queue.Queue(maxsize=QUEUE_MAXSIZE)
+_drain_requested = threading.Event()
+_last_notification = 0.0
+_start_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_threads: list = []
+
+STATS = {
+    "notifications": 0,
+    "drains": 0,
+    "drains_skipped": 0,
+    "fetched": 0,
+    "enqueued": 0,
+    "processed": 0,
+    "retried": 0,
+    "requeued": 0,
+    "catch_ups": 0,
+    "failed": 0,
+    "in_flight": 0,
+}
+_started_at = time.monotonic()
+
+def _bump(key: str, n: int = 1):
+    with _stats_lock:
+        STATS[key] += n
+
+def should_process(file: dict, folder_ids=None) -> bool:
+    """Filter a change's file resource down to items we actually route.
+
+    Only children of DRIVE_FOLDER_ID qualify, or of any of `folder_ids` when given.
+    """
+    fid = file.get("id")
+    mime = file.get("mimeType", "")
+    name = file.get("name", "")
+    if not fid:
+        return False
+    if fid in catalog().folder_ids:
+        log.debug("Skip label folder change", file=name, file_id=fid); return False
+    if mime == FOLDER_MIME:
+        log.debug("Skip folder item", file=name, file_id=fid); return False
+
+    # only handle items inside the watched folder
+    parents = file.get("parents", [])
+    scope = folder_ids or ([DRIVE_FOLDER_ID] if DRIVE_FOLDER_ID else [])
+    if scope and not any(p in scope for p in parents):
+        return False
+
+    if mime.startswith("application/vnd.google-apps.") and mime not in EXPORTABLE_GOOGLE_MIMES:
+        log.debug("Skip non-exportable Google item", file=name, file_id=fid, mime=mime)
+        return False
+    return True
+
+def enqueue(file: dict, attempt: int = 0, lease: bool = False):
+    """Blocking put: a full queue stalls the drainer instead of growing memory.
+
+    With `lease`, the changes lease is renewed while the put waits, so a long
+    stall cannot hand the feed to another process mid-drain.
+    """
+    while True:
+        try:
+            _jobs.put((file, attempt), timeout=JOURNAL_LEASE_SECONDS / 3 if lease else None)
+            break
+        except queue.Full:
+            if not journal.acquire_lease():
+                raise RuntimeError("Lost the changes lease while the queue was full")
+    if attempt == 0:
+        _bump("enqueued")
+
+def _sweep_state() -> dict | None:
+    """Where the folder feed's sweep should run from now, or None if the last one is recent."""
+    saved = journal.checkpoint("folder_sweep")
+    if saved is None:
+        # first sweep one interval after install, like the poll starting now
+        journal.set_checkpoint(json.dumps({"page_token": None, "at": time.time()}), "folder_sweep")
+        return None
+    state = json.loads(saved)
+    if state["page_token"]:
+        return state   # interrupted mid-sweep
+    if time.time() - state["at"] >= FOLDER_SWEEP_SECONDS:
+        return {"page_token": None, "at": time.time()}
+    return None
+
+def drain_changes(drive):
+    """Drain the configured feed into the queue, checkpointing after every page."""
+    if not journal.acquire_lease():
+        log.info("Another consumer holds the changes lease; skipping drain")
+        _bump("drains_skipped")
+        return
+    try:
+        _recover_pending()   # items a dead process left behind, whenever their claims lapse
+        if CHANGE_FEED == "folder":
+            key = "folder_since"
+            since = journal.checkpoint(key)
+            if since is None:
+                since = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+                journal.set_checkpoint(since, key)   # new installs start now; the first sweep picks up the rest
+            feeds = [(key, iter_folder_pages(drive, DRIVE_FOLDER_ID, since))]
+            sweep = _sweep_state()
+            if sweep:
+                log.info("Sweeping the watched folder", resumed=bool(sweep["page_token"]))
+                feeds.append(("folder_sweep", iter_folder_sweep(drive, DRIVE_FOLDER_ID, sweep)))
+        else:
+            key = "page_token"
+            feeds = [(key, iter_change_pages(drive, journal.page_token() or read_start_page_token(drive)))]
+
+        with metrics.span("drain", feed=CHANGE_FEED):
+            for key, items, checkpoint in ((k, i, c) for k, pages in feeds for i, c in pages):
+                accepted = [(file, t) for file, t in items if should_process(file)]
+                _bump("fetched", len(items))
+                metrics.inc("folderheist_changes_total", len(items), feed=CHANGE_FEED, state="fetched")
+                metrics.inc("folderheist_changes_total", len(accepted), feed=CHANGE_FEED, state="accepted")
+                # items + checkpoint commit together: a crash resumes at this page,
+                # and already-recorded (fileId, time) pairs are not enqueued twice
+                with metrics.span("journal_commit"):
+                    fresh = journal.commit_page(accepted, checkpoint, key=key)
+                for file, item_key in fresh:
+                    file["_journal"] = list(item_key)
+                    enqueue(file, lease=True)
+                journal.acquire_lease()   # renew while the backlog lasts
+        _bump("drains")
+    finally:
+        journal.release_lease()
+    journal.prune()
+
+def request_drain():
+    """Record a webhook notification; the drainer thread picks it up.
+
+    The event doubles as the "dirty" flag: notifications that arrive while a
+    drain is running leave it set, which buys exactly one follow-up pass.
+    """
+    global _last_notification
+    _bump("notifications")
+    _last_notification = time.monotonic()
+    start_workers()
+    _drain_requested.set()
+
+def request_catch_up():
+    """Drain without a notification (startup, a lapsed watch). It reads from the
+    journal's page token like any drain, so a large backlog still enters the
+    bounded queue one page at a time."""
+    _bump("catch_ups")
+    start_workers()
+    _drain_requested.set()
+
+def _debounce():
+    """Wait until notifications go quiet for DRAIN_DEBOUNCE_SECONDS (or DRAIN_MAX_DELAY passes)."""
+    first = time.monotonic()
+    while True:
+        now = time.monotonic()
+        quiet = now - _last_notification
+        if quiet >= DRAIN_DEBOUNCE_SECONDS or now - first >= DRAIN_MAX_DELAY:
+            return
+        time.sleep(min(DRAIN_DEBOUNCE_SECONDS - quiet, DRAIN_MAX_DELAY - (now - first)))
+
+def _drainer_loop():
+    # single thread: at most one drain in flight per process (the journal lease covers other processes)
+    # the folder feed is polled as well, since a watch only covers the changes feed
+    poll = FOLDER_POLL_SECONDS if CHANGE_FEED == "folder" else None
+    try:
+        _recover_pending(lease=False)   # what a previous run left pending, before the first notification
+    except Exception as e:
+        log.error("Journal recovery failed", error=str(e))
+    while True:
+        _drain_requested.wait(timeout=poll)
+        _debounce()
+        _drain_requested.clear()
+        try:
+            drive = get_drive()
+            ensure_catalog(drive)
+            drain_changes(drive)
+        except Exception as e:
+            log.error("Changes drain failed", error=str(e))
+            if quota.is_throttle(e):
+                # the checkpoint did not move; try again once the quota has had time to refill
+                time.sleep(quota.backoff(0, e))
+                _drain_requested.set()
+
+def _retry_later(file: dict, attempt: int, delay: float):
+    t = threading.Timer(delay, _jobs.put, args=((file, attempt),))
+    t.daemon = True
+    t.start()
+
+def _worker_loop():
+    while True:
+        file, attempt = _jobs.get()
+        _bump("in_flight")
+        try:
+            drive = get_drive()  # per-thread service; also refreshes the token ahead of expiry
+            routed = process_file(drive, file)
+            _bump("processed")
+            if not routed and file.get("_journal"):
+                journal.mark(file["_journal"], "done")   # skipped; routed files finish in the move stage
+        except Exception as e:
+            fid = file.get("id")
+            if quota.is_throttle(e):
+                # over quota is not the file's fault: requeue without spending a retry
+                throttles = file["_throttles"] = file.get("_throttles", 0) + 1
+                delay = quota.backoff(min(throttles, 10), e)
+                log.info("Throttled, requeued", file_id=fid, delay_s=round(delay, 2), error=str(e))
+                _bump("requeued")
+                metrics.inc("folderheist_requeued_total", stage="process")
+                _retry_later(file, attempt, delay)
+            elif attempt < PROCESS_MAX_RETRIES:
+                log.warning("Retrying", file_id=fid, attempt=attempt + 1, max_retries=PROCESS_MAX_RETRIES, error=str(e))
+                _bump("retried")
+                _retry_later(file, attempt + 1, quota.backoff(attempt, e))
+            else:
+                log.error("Processing failed, giving up", file_id=fid, error=str(e))
+                _bump("failed")
+                if file.get("_journal"):
+                    journal.mark(file["_journal"], "failed")
+        finally:
+            _bump("in_flight", -1)
+            _jobs.task_done()
+
+def _move_finished(file: dict, ok: bool):
+    if file.get("_journal"):
+        journal.mark(file["_journal"], "done" if ok else "failed")
+
+on_move_finished(_move_finished)
+
+def _recover_pending(lease: bool = True):
+    """Re-enqueue items recorded but never finished. Only items whose claim has
+    lapsed are taken, so work another live process holds is never redone."""
+    items = journal.claim_lapsed()
+    if items:
+        log.info("Resuming pending items from the journal", items=len(items))
+    for file, key in items:
+        file["_journal"] = list(key)
+        enqueue(file, lease=lease)
+
+def start_workers():
+    with _start_lock:
+        if _threads:
+            return
+        _threads.append(threading.Thread(target=_drainer_loop, name="drainer", daemon=True))
+        for i in range(max(1, WORKER_CONCURRENCY)):
+            _threads.append(threading.Thread(target=_worker_loop, name=f"worker-{i}", daemon=True))
+        for t in _threads:
+            t.start()
+        add_batch_callers(max(1, WORKER_CONCURRENCY))
+        log.info("Started drainer and workers", workers=max(1, WORKER_CONCURRENCY), queue_max=QUEUE_MAXSIZE)
+
+def queue_stats() -> dict:
+    with _stats_lock:
+        stats = dict(STATS)
+    uptime = max(time.monotonic() - _started_at, 1e-9)
+    stats["queue_depth"] = _jobs.qsize()
+    stats["queue_max"] = QUEUE_MAXSIZE
+    stats["workers"] = max(1, WORKER_CONCURRENCY)
+    stats["uptime_s"] = round(uptime, 1)
+    stats["files_per_sec"] = round(stats["processed"] / uptime, 3)
+    stats["notifications_coalesced"] = max(stats["notifications"] - stats["drains"] - stats["drains_skipped"], 0)
+    return stats
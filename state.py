@@ -1,5 +1,82 @@
-# Mutable runtime state shared across modules (simple, not threadsafe)
-LABEL_TO_ID: dict = {}
-LABEL_DESC: dict = {}
-ALLOWED: list = []
-LABEL_FOLDER_IDS: set = set()
+# Runtime label catalog shared across modules and threads.
+#
+# The catalog is an immutable CatalogSnapshot; hydration builds a new one and
+# publish() swaps the module reference in a single assignment, so readers never
+# take a lock and never see a half-updated catalog. Grab one snapshot per unit
+# of work (`cat = current()`) and read everything from it.
+import hashlib, json, os, time
+from types import MappingProxyType
+from ai_router import DEFAULT_KEYWORDS, KeywordMatcher
+
+def catalog_version(label_to_id: dict, label_desc: dict, allowed: list, label_keywords: dict) -> str:
+    """Stable digest of the catalog; doubles as the cache key for routing decisions."""
+    h = hashlib.sha1()
+    for lab in allowed:
+        fields = (lab, label_to_id.get(lab, ""), label_desc.get(lab, ""), label_keywords.get(lab, ""))
+        h.update(("\x1f".join(fields) + "\x1e").encode("utf-8"))
+    return h.hexdigest()[:16]
+
+class CatalogSnapshot:
+    __slots__ = ("version", "generation", "label_to_id", "label_desc", "allowed",
+                 "folder_ids", "keywords", "matcher", "created_at")
+
+    def __init__(self, label_to_id: dict, label_desc: dict, allowed: list,
+                 label_keywords: dict, generation: int = 0, created_at: float | None = None):
+        # Rows without keywords keep the built-in defaults for well-known labels
+        keywords = {lab: label_keywords.get(lab) or DEFAULT_KEYWORDS.get(lab, "") for lab in allowed}
+        setattr_ = object.__setattr__
+        setattr_(self, "label_to_id", MappingProxyType(dict(label_to_id)))
+        setattr_(self, "label_desc", MappingProxyType(dict(label_desc)))
+        setattr_(self, "allowed", tuple(allowed))
+        setattr_(self, "folder_ids", frozenset(label_to_id.values()))
+        setattr_(self, "keywords", MappingProxyType(keywords))
+        setattr_(self, "matcher", KeywordMatcher(keywords))
+        setattr_(self, "version", catalog_version(label_to_id, label_desc, list(allowed), keywords))
+        setattr_(self, "generation", generation)
+        setattr_(self, "created_at", created_at or time.time())
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CatalogSnapshot is immutable; publish a new one instead")
+
+    def __bool__(self) -> bool:
+        return bool(self.allowed) and bool(self.label_to_id)
+
+    def to_json(self) -> dict:
+        return {
+            "version": self.version,
+            "generation": self.generation,
+            "created_at": self.created_at,
+            "label_to_id": dict(self.label_to_id),
+            "label_desc": dict(self.label_desc),
+            "allowed": list(self.allowed),
+            "keywords": dict(self.keywords),
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> "CatalogSnapshot":
+        return cls(data["label_to_id"], data["label_desc"], data["allowed"], data.get("keywords") or {},
+                   generation=int(data.get("generation", 0)), created_at=data.get("created_at"))
+
+_current = CatalogSnapshot({}, {}, [], {})
+
+def current() -> CatalogSnapshot:
+    return _current
+
+def publish(snapshot: CatalogSnapshot) -> CatalogSnapshot:
+    global _current
+    _current = snapshot   # single reference assignment: atomic under the GIL
+    return snapshot
+
+def save_snapshot(snapshot: CatalogSnapshot, path: str) -> None:
+    """Write atomically so other processes never read a torn file."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(snapshot.to_json(), f)
+    os.replace(tmp, path)
+
+def load_snapshot(path: str) -> CatalogSnapshot | None:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return CatalogSnapshot.from_json(json.load(f))
+    except (OSError, ValueError, KeyError):
+        return None